@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Ultrahuman MCP Server
+
+Runs against synthetic day payloads shaped like the Partnership API response,
+so no API key or network access is needed.
+
+Usage:
+    python benchmark.py            # run all benchmarks
+    python benchmark.py memory     # run a single benchmark
+"""
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from array import array
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+import numpy as np
+
+from main import (
+    COMPRESSION_LEVEL,
+    DEFAULT_ANOMALY_METRICS,
+    DEFAULT_COHORT_METRICS,
+    ENCODERS,
+    DayRecord,
+    MetricsCache,
+    cohort_summary,
+    compact_sleep,
+    daily_metric_matrix,
+    glucose_profile,
+    linear_trends,
+    member_means,
+    percentile_ranks,
+    rolling_anomalies,
+    series_arrays,
+)
+
+DAY_START = 1705276800  # 2024-01-15T00:00:00Z
+
+
+def make_hypnogram(rng: random.Random, epochs: int) -> list:
+    """Per-epoch sleep stages in runs of a few minutes, cycling through the night"""
+    cycle = ["light", "deep", "light", "rem", "awake"]
+    labels = []
+    while len(labels) < epochs:
+        labels.extend([cycle[len(labels) // 7 % len(cycle)]] * rng.randint(4, 40))
+    return labels[:epochs]
+
+
+def make_day_payload(seed: int = 0) -> dict:
+    """Build a realistic full-day metrics payload with intraday series"""
+    rng = random.Random(seed)
+    start = DAY_START + seed * 86400
+    return {
+        "hrv": rng.randint(30, 90),
+        "recovery_index": rng.randint(40, 95),
+        "steps": rng.randint(2000, 15000),
+        "vo2_max": round(rng.uniform(35, 55), 1),
+        "metabolic_score": rng.randint(50, 95),
+        "movement_index": rng.randint(40, 95),
+        "glucose_variability": round(rng.uniform(10, 30), 1),
+        "average_glucose": round(rng.uniform(85, 120), 1),
+        "hba1c": round(rng.uniform(4.8, 5.9), 1),
+        "time_in_target": round(rng.uniform(70, 99), 1),
+        "heart_rate": [
+            {"timestamp": start + i * 60, "value": rng.randint(50, 120)} for i in range(1440)
+        ],
+        "glucose": [
+            {"timestamp": start + i * 300, "value": round(rng.gauss(100, 15), 1)} for i in range(288)
+        ],
+        "temperature": [
+            {"timestamp": start + i * 300, "value": round(rng.gauss(36.5, 0.3), 2)} for i in range(288)
+        ],
+        "sleep_data": {
+            "score": rng.randint(50, 95),
+            "bedtime_start": start - 3600,
+            "stages": make_hypnogram(rng, 960),
+            "movement": [rng.randint(0, 10) for _ in range(960)],
+        },
+        "movement_data": {
+            "active_minutes": rng.randint(10, 120),
+            "steps_by_hour": [rng.randint(0, 2000) for _ in range(24)],
+        },
+    }
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """Approximate retained size of an object graph in bytes"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    elif isinstance(obj, array):
+        pass
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    return size
+
+
+def bench_memory(days: int = 200):
+    """Bytes per cached user-day: raw response.json() dicts vs compact DayRecords"""
+    print(f"Memory per cached user-day ({days} days)")
+    wire = raw = compact = 0
+    cache = MetricsCache(max_days=days)
+    for i in range(days):
+        text = json.dumps(make_day_payload(i))
+        wire += len(text)
+        raw += deep_sizeof(json.loads(text))
+        cache.put("user@example.com", (date(2024, 1, 15) + timedelta(days=i)).isoformat(), json.loads(text))
+
+    seen = set()
+    for record in cache._records.values():
+        compact += deep_sizeof(record, seen)
+
+    sample = make_day_payload(0)
+    assert DayRecord(json.loads(json.dumps(sample)), 0).to_dict() == sample
+
+    print(f"   wire JSON:      {wire / days:>10,.0f} bytes/day")
+    print(f"   raw dicts:      {raw / days:>10,.0f} bytes/day")
+    print(f"   DayRecord:      {compact / days:>10,.0f} bytes/day  ({raw / compact:.1f}x smaller)")
+    print()
+
+
+def bench_compression(repeat: int = 50):
+    """Bytes on the wire and CPU time per full-day get_user_metrics response"""
+    response = {
+        "success": True,
+        "email": "user@example.com",
+        "date": "2024-01-15",
+        "metrics": make_day_payload(0),
+    }
+    body = json.dumps(response).encode()
+    print(f"Compression per full-day response (level {COMPRESSION_LEVEL}, {repeat} runs)")
+    print(f"   {'identity':<10}{len(body):>10,} bytes")
+    for name, encoder_cls in ENCODERS.items():
+        start = time.process_time()
+        for _ in range(repeat):
+            encoder = encoder_cls(COMPRESSION_LEVEL)
+            compressed = encoder.compress(body) + encoder.finish()
+        cpu_ms = (time.process_time() - start) / repeat * 1000
+        print(
+            f"   {name:<10}{len(compressed):>10,} bytes  "
+            f"({len(body) / len(compressed):4.1f}x)  {cpu_ms:6.2f} ms CPU"
+        )
+    print()
+
+
+def _timeit(fn, repeat: int) -> float:
+    """Mean wall time of fn() in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench_glucose(days: int = 14, repeat: int = 20):
+    """Server-side AGP computation over a multi-day range of raw CGM samples"""
+    payloads = [make_day_payload(i) for i in range(days)]
+
+    def run():
+        series = [series_arrays(p["glucose"]) for p in payloads]
+        glucose_profile(np.concatenate([s[0] for s in series]), np.concatenate([s[1] for s in series]))
+
+    samples = sum(len(p["glucose"]) for p in payloads)
+    print(f"Glucose AGP ({days} days, {samples:,} samples)")
+    print(f"   {_timeit(run, repeat):.2f} ms per profile")
+    print()
+
+
+def bench_anomalies(days: int = 365, repeat: int = 10):
+    """Rolling z-score, EWMA, change-point and trend analysis over a year of days"""
+    payloads = [make_day_payload(i) for i in range(days)]
+
+    def run():
+        _, values = daily_metric_matrix(payloads, DEFAULT_ANOMALY_METRICS)
+        rolling_anomalies(values)
+        linear_trends(values)
+
+    print(f"Anomaly detection ({days} days)")
+    print(f"   {_timeit(run, repeat):.2f} ms per analysis (including matrix build)")
+    print()
+
+
+def bench_sleep(nights: int = 7, repeat: int = 100):
+    """Compact sleep-stage encoding: time per night and response size reduction"""
+    nights_data = [make_day_payload(i)["sleep_data"] for i in range(nights)]
+    raw = sum(len(json.dumps(n)) for n in nights_data)
+    compact = sum(len(json.dumps(compact_sleep(n))) for n in nights_data)
+    per_night = _timeit(lambda: [compact_sleep(n) for n in nights_data], repeat) / nights
+    print(f"Compact sleep encoding ({nights} nights)")
+    print(f"   {per_night:.3f} ms per night")
+    print(f"   {raw / nights:,.0f} -> {compact / nights:,.0f} bytes per night ({raw / compact:.1f}x smaller)")
+    print()
+
+
+def bench_cohort(members: int = 500, days: int = 7, repeat: int = 3):
+    """Cohort percentile ranking: per-member averaging plus ranking, excluding fetch time"""
+    payloads = [make_day_payload(i) for i in range(days * 10)]
+    cohort = [[payloads[(m + d) % len(payloads)] for d in range(days)] for m in range(members)]
+
+    def run():
+        results = [member_means(member_days, DEFAULT_COHORT_METRICS)[0] for member_days in cohort]
+        names = list(dict.fromkeys(name for means in results for name in means))
+        values = np.array([[means.get(name, np.nan) for name in names] for means in results])
+        return percentile_ranks(values), cohort_summary(values)
+
+    rank_values = np.random.default_rng(0).normal(size=(members, 12))
+    print(f"Cohort percentiles ({members} members x {days} days)")
+    print(f"   {_timeit(run, repeat):.1f} ms per cohort (averaging + ranking)")
+    print(f"   {_timeit(lambda: percentile_ranks(rank_values), repeat * 10):.2f} ms ranking alone ({members} x 12 matrix)")
+    print()
+
+
+class _FakeUpstream(BaseHTTPRequestHandler):
+    """Stands in for the Partnership API, serving synthetic day payloads"""
+
+    body = json.dumps(make_day_payload(0)).encode()
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _sse_json(response: httpx.Response) -> dict:
+    for line in response.text.splitlines():
+        if line.startswith("data:"):
+            return json.loads(line[5:])
+    return response.json()
+
+
+def _first_tool_call(client: httpx.Client, base_url: str) -> bool:
+    """Run the MCP handshake and one get_user_metrics call over HTTP"""
+    headers = {"Accept": "application/json, text/event-stream"}
+    init = client.post(f"{base_url}/mcp", headers=headers, json={
+        "jsonrpc": "2.0", "id": 1, "method": "initialize",
+        "params": {"protocolVersion": "2024-11-05", "capabilities": {},
+                   "clientInfo": {"name": "benchmark", "version": "1.0.0"}},
+    })
+    headers["mcp-session-id"] = init.headers["mcp-session-id"]
+    client.post(f"{base_url}/mcp", headers=headers, json={"jsonrpc": "2.0", "method": "notifications/initialized"})
+    result = client.post(f"{base_url}/mcp", headers=headers, json={
+        "jsonrpc": "2.0", "id": 2, "method": "tools/call",
+        "params": {"name": "get_user_metrics", "arguments": {"email": "user@example.com", "date": "2024-01-15"}},
+    })
+    content = _sse_json(result)["result"]["content"][0]["text"]
+    return json.loads(content)["success"]
+
+
+def bench_startup(runs: int = 5):
+    """Cold start: process launch to readiness and to the first successful tool call"""
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), _FakeUpstream)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Built up front: creating an httpx client (SSL context) costs ~200 ms,
+    # which would otherwise be counted against the server
+    client = httpx.Client(timeout=30)
+
+    print(f"Startup ({runs} runs per mode, local fake upstream)")
+    for warmup in ("0", "1"):
+        ready_times, first_call_times, call_times, import_times = [], [], [], []
+        for _ in range(runs):
+            port = _free_port()
+            env = {
+                **os.environ,
+                "PORT": str(port),
+                "ULTRAHUMAN_AUTH_KEY": "benchmark",
+                "ULTRAHUMAN_BASE_URL": f"http://127.0.0.1:{upstream.server_port}",
+                "ULTRAHUMAN_WARMUP": warmup,
+            }
+            started = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, "main.py"], cwd=here, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            base_url = f"http://127.0.0.1:{port}"
+            try:
+                while True:
+                    try:
+                        ready = client.get(f"{base_url}/ready", timeout=1)
+                        if ready.status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    time.sleep(0.01)
+                ready_times.append(time.perf_counter() - started)
+                import_times.append(ready.json()["import_seconds"])
+                assert _first_tool_call(client, base_url)
+                first_call_times.append(time.perf_counter() - started)
+                call_times.append(first_call_times[-1] - ready_times[-1])
+            finally:
+                process.terminate()
+                process.wait()
+
+        mode = "warm-up on " if warmup == "1" else "warm-up off"
+        print(
+            f"   {mode}: import {sum(import_times) / runs * 1000:6.0f} ms, "
+            f"ready {sum(ready_times) / runs * 1000:6.0f} ms, "
+            f"first tool call {sum(first_call_times) / runs * 1000:6.0f} ms "
+            f"({sum(call_times) / runs * 1000:4.0f} ms after ready)"
+        )
+    client.close()
+    upstream.shutdown()
+    print()
+
+
+BENCHMARKS = {
+    "memory": bench_memory,
+    "compression": bench_compression,
+    "glucose": bench_glucose,
+    "anomalies": bench_anomalies,
+    "sleep": bench_sleep,
+    "cohort": bench_cohort,
+    "startup": bench_startup,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
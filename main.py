@@ -3,20 +3,360 @@ Ultrahuman MCP Server
 
 This server provides access to Ultrahuman Partnership API data through MCP tools.
 """
+from __future__ import annotations
+
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 import os
+import io
+import csv
+import sys
+import json
+import zlib
+import heapq
 import asyncio
-from datetime import datetime, date
-from typing import Optional, Dict, Any
+import logging
+import warnings
+import secrets
+import itertools
+import functools
+import importlib.util
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, date, timedelta, timezone
+from typing import Optional, Dict, Any, Iterator, List, Set, Tuple
 import httpx
 from fastmcp import FastMCP
+from fastmcp.server.middleware import Middleware as MCPMiddleware, MiddlewareContext
+from pydantic import AnyUrl
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+try:
+    import brotli  # optional: enables "br" encoding
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard  # optional: enables "zstd" encoding
+except ImportError:
+    zstandard = None
+
+
+
+class _LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    The first access does a plain import, which the import system serializes
+    across threads (importlib's LazyLoader does not on Python 3.11), and
+    rebinds the global to the real module so later lookups go straight to it.
+    """
+
+    def __init__(self, name: str, binding: str):
+        self._name = name
+        self._binding = binding
+
+    def __getattr__(self, attr: str):
+        module = importlib.import_module(self._name)
+        globals()[self._binding] = module
+        return getattr(module, attr)
+
+
+# Only the analytics tools need NumPy, so it is not part of the cold start
+np = sys.modules.get("numpy") or _LazyModule("numpy", "np")
+
+# Optional: enables Parquet exports; imported on first use by _load_pyarrow()
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+pa = pq = None
 
 # Initialize FastMCP server
 mcp = FastMCP("Ultrahuman")
+logger = logging.getLogger(__name__)
 
 # Environment variables for configuration
 ULTRAHUMAN_AUTH_KEY = os.getenv("ULTRAHUMAN_AUTH_KEY")
 ULTRAHUMAN_BASE_URL = os.getenv("ULTRAHUMAN_BASE_URL", "https://partner.ultrahuman.com/api/v1")
 DEFAULT_EMAIL = os.getenv("ULTRAHUMAN_DEFAULT_EMAIL")
+CACHE_MAX_DAYS = int(os.getenv("ULTRAHUMAN_CACHE_MAX_DAYS", 5000))
+CACHE_TODAY_TTL = int(os.getenv("ULTRAHUMAN_CACHE_TODAY_TTL", 300))
+SETTLE_HOURS = int(os.getenv("ULTRAHUMAN_SETTLE_HOURS", 24))
+MAX_RANGE_DAYS = int(os.getenv("ULTRAHUMAN_MAX_RANGE_DAYS", 366))
+FETCH_CONCURRENCY = int(os.getenv("ULTRAHUMAN_FETCH_CONCURRENCY", 8))
+EXPORT_DIR = os.getenv("ULTRAHUMAN_EXPORT_DIR", "exports")
+EXPORT_BATCH_DAYS = int(os.getenv("ULTRAHUMAN_EXPORT_BATCH_DAYS", 64))
+WATCH_INTERVAL = int(os.getenv("ULTRAHUMAN_WATCH_INTERVAL", 60))
+MAX_COHORT_SIZE = int(os.getenv("ULTRAHUMAN_MAX_COHORT_SIZE", 1000))
+COHORT_CONCURRENCY = int(os.getenv("ULTRAHUMAN_COHORT_CONCURRENCY", 32))
+COMPRESSION_ENABLED = os.getenv("ULTRAHUMAN_COMPRESSION", "1") != "0"
+COMPRESSION_MIN_SIZE = int(os.getenv("ULTRAHUMAN_COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_LEVEL = int(os.getenv("ULTRAHUMAN_COMPRESSION_LEVEL", 6))
+WARMUP_ENABLED = os.getenv("ULTRAHUMAN_WARMUP", "1") != "0"
+TRACE_EXPORTER = os.getenv("ULTRAHUMAN_TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("ULTRAHUMAN_TRACE_FILE", "traces.jsonl")
+SLOW_LOG_SIZE = int(os.getenv("ULTRAHUMAN_SLOW_LOG_SIZE", 20))
+DEBUG_TOKEN = os.getenv("ULTRAHUMAN_DEBUG_TOKEN")
+
+# Encodings httpx can decode in this environment, advertised to the upstream API
+# (br and zstd need the optional packages; zstd decoding needs httpx>=0.27.1)
+UPSTREAM_ACCEPT_ENCODING = ", ".join(
+    ["gzip", "deflate"] + (["br"] if brotli else []) + (["zstd"] if zstandard else [])
+)
+
+
+# Spans kept per trace; long range requests beyond this are only counted
+MAX_TRACE_SPANS = 1000
+
+
+class _Trace:
+    __slots__ = ("trace_id", "spans", "dropped")
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List["Span"] = []
+        self.dropped = 0
+
+
+# OTLP status codes and span kinds
+_OTLP_STATUS = {"OK": 1, "ERROR": 2}
+_OTLP_KIND_INTERNAL, _OTLP_KIND_SERVER = 1, 2
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Encode an attribute value as an OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ("trace", "name", "span_id", "parent_span_id", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, trace: _Trace, name: str, parent_span_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = "OK"
+        if len(trace.spans) < MAX_TRACE_SPANS:
+            trace.spans.append(self)
+        else:
+            trace.dropped += 1
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """The span as an OTLP/JSON Span message"""
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": _OTLP_KIND_INTERNAL if self.parent_span_id else _OTLP_KIND_SERVER,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": _OTLP_STATUS[self.status]}
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+class _NullSpan:
+    """Stands in for a span when there is no trace to record it in"""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class SlowRequestLog:
+    """Keeps the N slowest finished traces with their span breakdown"""
+
+    def __init__(self, size: int = 20):
+        self.size = size
+        self._heap: List[Tuple[int, int, Span]] = []
+        self._counter = itertools.count()
+
+    def add(self, root: Span) -> None:
+        if self.size <= 0:
+            return
+        entry = (root.end_ns - root.start_ns, next(self._counter), root)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, entry)
+        elif entry[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        requests = []
+        for duration, _, root in sorted(self._heap, key=lambda e: e[0], reverse=True):
+            requests.append({
+                "name": root.name,
+                "trace_id": root.trace.trace_id,
+                "started_at": datetime.fromtimestamp(root.start_ns / 1e9).isoformat(),
+                "duration_ms": round(duration / 1e6, 2),
+                "status": root.status,
+                "attributes": root.attributes,
+                "dropped_spans": root.trace.dropped,
+                "spans": [
+                    {
+                        "name": span.name,
+                        "offset_ms": round((span.start_ns - root.start_ns) / 1e6, 2),
+                        "duration_ms": round((span.end_ns - span.start_ns) / 1e6, 2),
+                        "status": span.status,
+                        "attributes": span.attributes
+                    }
+                    for span in root.trace.spans
+                    if span is not root and span.end_ns is not None
+                ]
+            })
+        return requests
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("ultrahuman_current_span", default=None)
+
+
+class Tracer:
+    """Lightweight in-process tracer.
+
+    A trace is started explicitly with trace() (once per tool call, or per
+    unit of background work); span() only records inside one, so helpers
+    called from anywhere else cost nothing and never show up as requests.
+    Finished traces go to the slow-request log and, optionally, to a console
+    or file exporter writing one OTLP/JSON ExportTraceServiceRequest per
+    line, the format read by the OpenTelemetry Collector's otlpjsonfile
+    receiver.
+    """
+
+    def __init__(self, exporter: str = "none", path: str = "traces.jsonl", slow_log_size: int = 20):
+        self.exporter = exporter
+        self.path = path
+        self.slow_log = SlowRequestLog(slow_log_size)
+
+    @contextmanager
+    def trace(self, name: str, slow_log: bool = True, **attributes: Any) -> Iterator[Span]:
+        """Start a new trace whose root span covers the block"""
+        root = None
+        try:
+            with self._span(_Trace(), name, None, attributes) as root:
+                yield root
+        finally:
+            if root is not None:
+                if slow_log:
+                    self.slow_log.add(root)
+                self._export(root)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Record a child of the current span; a no-op outside a trace"""
+        parent = _current_span.get()
+        if parent is None:
+            yield _NULL_SPAN
+            return
+        with self._span(parent.trace, name, parent.span_id, attributes) as span:
+            yield span
+
+    @contextmanager
+    def _span(self, trace: _Trace, name: str, parent_span_id: Optional[str], attributes: Dict[str, Any]) -> Iterator[Span]:
+        span = Span(trace, name, parent_span_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "ERROR"
+            # Exception messages can carry the upstream URL (and with it the
+            # user's email), so only the type and HTTP status are kept
+            span.set(**{"error.type": type(e).__name__})
+            if isinstance(e, httpx.HTTPStatusError):
+                span.set(**{"http.response.status_code": e.response.status_code})
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+
+    def record(self, name: str, start_ns: int, end_ns: int, **attributes: Any) -> None:
+        """Add an already-finished child span to the current span"""
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = Span(parent.trace, name, parent.span_id, attributes)
+        span.start_ns, span.end_ns = start_ns, end_ns
+
+    def _export(self, root: Span) -> None:
+        if self.exporter not in ("console", "file"):
+            return
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "ultrahuman-mcp"}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "ultrahuman-mcp"},
+                    "spans": [span.to_otlp() for span in root.trace.spans if span.end_ns is not None]
+                }]
+            }]
+        }
+        lines = json.dumps(request) + "\n"
+        if self.exporter == "console":
+            sys.stderr.write(lines)
+        else:
+            with open(self.path, "a") as f:
+                f.write(lines)
+
+
+tracer = Tracer(TRACE_EXPORTER, TRACE_FILE, SLOW_LOG_SIZE)
+
+
+class _HttpPhases:
+    """httpx trace extension hook collecting connect, TLS, TTFB and download timings"""
+
+    PHASES = (
+        ("upstream.connect", "connect_tcp.started", "connect_tcp.complete"),
+        ("upstream.tls", "start_tls.started", "start_tls.complete"),
+        ("upstream.ttfb", "send_request_headers.started", "receive_response_headers.complete"),
+        ("upstream.download", "receive_response_body.started", "receive_response_body.complete"),
+    )
+
+    def __init__(self):
+        self.events: Dict[str, int] = {}
+
+    async def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        # Strip the "connection." / "http11." / "http2." prefix
+        self.events[event_name.split(".", 1)[-1]] = time.time_ns()
+
+    def record(self) -> None:
+        for name, start, end in self.PHASES:
+            if start in self.events and end in self.events:
+                tracer.record(name, self.events[start], self.events[end])
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared upstream connection pool, so requests reuse warm TLS connections"""
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient()
+        _http_client_loop = loop
+    return _http_client
 
 
 class UltrahumanClient:
@@ -27,7 +367,8 @@ class UltrahumanClient:
         self.base_url = base_url
         self.headers = {
             "Authorization": auth_key,
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            "Accept-Encoding": UPSTREAM_ACCEPT_ENCODING
         }
     
     async def get_metrics(self, email: str, date_str: str) -> Dict[str, Any]:
@@ -38,12 +379,365 @@ class UltrahumanClient:
             "date": date_str
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=self.headers, params=params)
+        phases = _HttpPhases()
+        with tracer.span("upstream.request", **{"http.request.method": "GET", "url.path": "/metrics"}) as span:
+            with tracer.span("http_client.init"):
+                client = get_http_client()
+            response = await client.get(
+                url, headers=self.headers, params=params, extensions={"trace": phases}
+            )
+            phases.record()
+            span.set(**{
+                "http.response.status_code": response.status_code,
+                "http.response.body.size": len(response.content)
+            })
             response.raise_for_status()
+
+        with tracer.span("json.parse"):
             return response.json()
 
 
+# Daily scalar metrics stored directly in DayRecord slots
+SCALAR_FIELDS = (
+    "hrv",
+    "recovery_index",
+    "steps",
+    "vo2_max",
+    "metabolic_score",
+    "movement_index",
+    "glucose_variability",
+    "average_glucose",
+    "hba1c",
+    "time_in_target",
+)
+
+# Marks a scalar field that was absent from the payload (as opposed to null)
+_MISSING = object()
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _Columns:
+    """Columnar storage for a list of flat numeric records (e.g. timestamp/value points)"""
+
+    __slots__ = ("keys", "columns")
+
+    def __init__(self, keys: Tuple[str, ...], columns: Tuple[Any, ...]):
+        self.keys = keys
+        self.columns = columns
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [dict(zip(self.keys, row)) for row in zip(*(_unpack(col) for col in self.columns))]
+
+
+class _MixedNumbers:
+    """Float64 storage for a list mixing ints and floats, remembering which were ints"""
+
+    __slots__ = ("values", "is_int")
+
+    def __init__(self, values: List[Any]):
+        self.values = array("d", values)
+        self.is_int = bytes(isinstance(v, int) for v in values)
+
+    def tolist(self) -> List[Any]:
+        return [int(v) if flag else v for v, flag in zip(self.values.tolist(), self.is_int)]
+
+
+# Largest magnitude up to which every int is exactly representable as a float64
+_MAX_EXACT_FLOAT_INT = 2 ** 53
+
+
+def _pack_numbers(values: List[Any]) -> Any:
+    """Pack numbers into a typed array, keeping each element's JSON type on the way back"""
+    ints = [isinstance(v, int) for v in values]
+    if all(ints):
+        try:
+            return array("q", values)
+        except OverflowError:
+            return list(values)
+    if not any(ints):
+        return array("d", values)
+    if all(abs(v) <= _MAX_EXACT_FLOAT_INT for v, is_int in zip(values, ints) if is_int):
+        return _MixedNumbers(values)
+    return list(values)
+
+
+def _pack(value: Any) -> Any:
+    """Convert a decoded JSON value into its compact cached form"""
+    if isinstance(value, dict):
+        return {sys.intern(k): _pack(v) for k, v in value.items()}
+    if not isinstance(value, list) or not value:
+        return value
+    if all(_is_number(v) for v in value):
+        return _pack_numbers(value)
+    first = value[0]
+    if isinstance(first, dict) and first and all(_is_number(v) for v in first.values()):
+        keys = tuple(first)
+        if all(
+            isinstance(item, dict)
+            and tuple(item) == keys
+            and all(_is_number(v) for v in item.values())
+            for item in value
+        ):
+            columns = tuple(_pack_numbers([item[k] for item in value]) for k in keys)
+            return _Columns(tuple(sys.intern(k) for k in keys), columns)
+    if all(isinstance(v, str) for v in value):
+        # Repeated labels (sleep stages etc.) share a single string object
+        return [sys.intern(v) for v in value]
+    return [_pack(v) for v in value]
+
+
+def _unpack(value: Any) -> Any:
+    """Rehydrate a compact cached value back into plain JSON types"""
+    if isinstance(value, dict):
+        return {k: _unpack(v) for k, v in value.items()}
+    if isinstance(value, (array, _MixedNumbers)):
+        return value.tolist()
+    if isinstance(value, _Columns):
+        return value.to_list()
+    if isinstance(value, list):
+        return [_unpack(v) for v in value]
+    return value
+
+
+class DayRecord:
+    """Compact cached representation of one user-day of metrics.
+
+    Scalar metrics live in slots, intraday series in typed arrays; the plain
+    dict is only rebuilt by to_dict() when a tool needs it.
+    """
+
+    __slots__ = SCALAR_FIELDS + ("other", "fetched_at")
+
+    def __init__(self, metrics: Dict[str, Any], fetched_at: float):
+        other = {}
+        for key in SCALAR_FIELDS:
+            setattr(self, key, _MISSING)
+        for key, value in metrics.items():
+            if key in SCALAR_FIELDS and (value is None or _is_number(value)):
+                setattr(self, key, value)
+            else:
+                other[sys.intern(key)] = _pack(value)
+        self.other = other
+        self.fetched_at = fetched_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {}
+        for key in SCALAR_FIELDS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                result[key] = value
+        result.update(_unpack(self.other))
+        return result
+
+
+@functools.lru_cache(maxsize=4096)
+def day_settled_at(date_str: str) -> float:
+    """Unix time after which a day's data no longer changes upstream.
+
+    That is once the day has ended in every timezone (the last being UTC-12)
+    and the late syncs have had SETTLE_HOURS to arrive.
+    """
+    day = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return (day + timedelta(days=1, hours=12 + SETTLE_HOURS)).timestamp()
+
+
+class MetricsCache:
+    """Bounded LRU cache of DayRecords keyed by (email, date).
+
+    Data fetched after its day settled never changes and is kept until
+    evicted; anything fetched earlier (today, yesterday before the ring
+    synced, a user ahead of the server's timezone) expires after a short TTL.
+    """
+
+    def __init__(self, max_days: int = 5000, today_ttl: int = 300):
+        self.max_days = max_days
+        self.today_ttl = today_ttl
+        self._records: "OrderedDict[Tuple[str, str], DayRecord]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, email: str, date_str: str) -> Optional[Dict[str, Any]]:
+        key = (email, date_str)
+        record = self._records.get(key)
+        if record is None:
+            return None
+        if record.fetched_at < day_settled_at(date_str) and time.time() - record.fetched_at > self.today_ttl:
+            del self._records[key]
+            return None
+        self._records.move_to_end(key)
+        return record.to_dict()
+
+    def put(self, email: str, date_str: str, metrics: Any) -> None:
+        if self.max_days <= 0 or not isinstance(metrics, dict):
+            return
+        key = (email, date_str)
+        self._records[key] = DayRecord(metrics, time.time())
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_days:
+            self._records.popitem(last=False)
+
+    def clear(self) -> None:
+        self._records.clear()
+
+
+metrics_cache = MetricsCache(CACHE_MAX_DAYS, CACHE_TODAY_TTL)
+
+
+async def fetch_day_metrics(
+    email: str, date_str: str, use_cache: bool = True, store: bool = True
+) -> Dict[str, Any]:
+    """Fetch raw metrics for one user-day, served from the in-memory cache when possible.
+
+    With store=False a fetched day is not added to the cache, so bulk reads
+    don't evict the days interactive tools are using.
+    """
+    if use_cache:
+        with tracer.span("cache.lookup") as span:
+            cached = metrics_cache.get(email, date_str)
+            span.set(hit=cached is not None)
+        if cached is not None:
+            return cached
+
+    with tracer.span("client.init"):
+        client = UltrahumanClient(ULTRAHUMAN_AUTH_KEY, ULTRAHUMAN_BASE_URL)
+    metrics = await client.get_metrics(email, date_str)
+    if store:
+        with tracer.span("cache.store"):
+            metrics_cache.put(email, date_str, metrics)
+    return metrics
+
+
+def parse_date_bounds(start_date: str, end_date: str, max_days: Optional[int] = MAX_RANGE_DAYS) -> Tuple[date, int]:
+    """Validate a date range and return its first date and length in days"""
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("Date must be in YYYY-MM-DD format")
+    if end < start:
+        raise ValueError("end_date must not be before start_date")
+    days = (end - start).days + 1
+    if max_days is not None and days > max_days:
+        raise ValueError(f"Date range must not exceed {max_days} days")
+    return start, days
+
+
+def parse_date_range(start_date: str, end_date: str, max_days: Optional[int] = MAX_RANGE_DAYS) -> List[str]:
+    """Validate a date range and expand it into a list of YYYY-MM-DD strings"""
+    start, days = parse_date_bounds(start_date, end_date, max_days)
+    return [(start + timedelta(days=i)).isoformat() for i in range(days)]
+
+
+async def fetch_days(
+    requests: List[Tuple[str, str]],
+    concurrency: int = FETCH_CONCURRENCY,
+    use_cache: bool = True,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    store: bool = True,
+) -> List[Any]:
+    """Fetch many (email, date) user-days with bounded concurrency.
+
+    Results come back in request order; a day that failed is returned as its
+    exception instead of raising. Pass a semaphore to share one concurrency
+    limit across several concurrent calls.
+    """
+    semaphore = semaphore or asyncio.Semaphore(concurrency)
+
+    async def fetch(email: str, date_str: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await fetch_day_metrics(email, date_str, use_cache, store)
+
+    return await asyncio.gather(*(fetch(e, d) for e, d in requests), return_exceptions=True)
+
+
+def fetch_error(error: BaseException) -> str:
+    """Describe a failed user-day fetch the way the single-day tools do"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"HTTP {error.response.status_code}: {error.response.text}"
+    return str(error)
+
+
+def failed_dates(dates: List[str], results: List[Any]) -> List[str]:
+    """Dates whose fetch raised, from fetch_days results in request order"""
+    return [d for d, result in zip(dates, results) if isinstance(result, BaseException)]
+
+
+def first_error(results: List[Any], default: str) -> str:
+    """The first fetch error among fetch_days results, or default when none failed"""
+    errors = [r for r in results if isinstance(r, BaseException)]
+    return fetch_error(errors[0]) if errors else default
+
+
+def series_arrays(value: Any) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Extract (timestamps, values) arrays from an intraday series.
+
+    Accepts a list of {"timestamp", "value"} points or a dict wrapping such a
+    list under "values". Millisecond timestamps are converted to seconds.
+    Points with a null or non-finite timestamp or value are dropped.
+    """
+    if isinstance(value, dict):
+        value = value.get("values")
+    if not isinstance(value, list) or not value:
+        return None
+    try:
+        pairs = np.array([(p["timestamp"], p["value"]) for p in value], dtype=np.float64)
+    except (TypeError, KeyError, ValueError):
+        # Slow path: skip malformed points and gaps (null values)
+        pairs = np.array([
+            (p["timestamp"], p["value"]) for p in value
+            if isinstance(p, dict) and _is_number(p.get("timestamp")) and _is_number(p.get("value"))
+        ], dtype=np.float64)
+    if len(pairs):
+        # The fast path turns {"value": null} into NaN rather than raising
+        pairs = pairs[np.isfinite(pairs).all(axis=1)]
+    if not len(pairs):
+        return None
+    timestamps, values = pairs[:, 0].copy(), pairs[:, 1].copy()
+    if timestamps[0] > 1e12:
+        timestamps /= 1000.0
+    return timestamps, values
+
+
+async def fetch_user_metrics(email: str, date: str) -> Dict[str, Any]:
+    """Shared implementation of get_user_metrics, also used by the category tools"""
+    with tracer.span("validate"):
+        if not ULTRAHUMAN_AUTH_KEY:
+            raise ValueError("ULTRAHUMAN_AUTH_KEY environment variable is required")
+        
+        # Validate date format
+        try:
+            datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            raise ValueError("Date must be in YYYY-MM-DD format")
+    
+    try:
+        metrics = await fetch_day_metrics(email, date)
+        return {
+            "success": True,
+            "email": email,
+            "date": date,
+            "metrics": metrics
+        }
+    except httpx.HTTPStatusError as e:
+        return {
+            "success": False,
+            "error": f"HTTP {e.response.status_code}: {e.response.text}",
+            "email": email,
+            "date": date
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "email": email,
+            "date": date
+        }
+
+
 @mcp.tool
 async def get_default_user_metrics(date: str) -> Dict[str, Any]:
     """
@@ -62,7 +756,7 @@ async def get_default_user_metrics(date: str) -> Dict[str, Any]:
             "date": date
         }
     
-    return await get_user_metrics(DEFAULT_EMAIL, date)
+    return await fetch_user_metrics(DEFAULT_EMAIL, date)
 
 
 @mcp.tool
@@ -92,59 +786,166 @@ async def get_user_metrics(email: str, date: str) -> Dict[str, Any]:
         - Movement Index
         - VO2 Max
     """
-    if not ULTRAHUMAN_AUTH_KEY:
-        raise ValueError("ULTRAHUMAN_AUTH_KEY environment variable is required")
-    
-    # Validate date format
-    try:
-        datetime.strptime(date, "%Y-%m-%d")
-    except ValueError:
-        raise ValueError("Date must be in YYYY-MM-DD format")
-    
-    client = UltrahumanClient(ULTRAHUMAN_AUTH_KEY, ULTRAHUMAN_BASE_URL)
-    
+    return await fetch_user_metrics(email, date)
+
+
+AWAKE_STAGES = frozenset({"awake", "wake", "w"})
+# Stage labels used by sleep staging (AASM, consumer wearables); other string
+# series are only treated as hypnograms when their key says so
+SLEEP_STAGES = AWAKE_STAGES | frozenset({
+    "light", "deep", "rem", "core", "asleep", "sleep", "n1", "n2", "n3", "n4", "r", "unknown",
+})
+_STAGE_SERIES_KEYS = ("stage", "hypnogram")
+UNKNOWN_STAGE = "unknown"
+SLEEP_EPOCH_SECONDS = 30
+_STAGE_LABEL_KEYS = ("stage", "type", "value")
+_SLEEP_START_KEYS = ("bedtime_start", "start", "start_time")
+
+
+def _looks_like_stages(key: str, labels: List[Any]) -> bool:
+    if any(name in key.lower() for name in _STAGE_SERIES_KEYS):
+        return True
+    names = {label.lower() for label in labels if isinstance(label, str)}
+    return bool(names) and names <= SLEEP_STAGES
+
+
+def stage_series(value: Any, key: str = "") -> Optional[Tuple[List[str], Optional[np.ndarray]]]:
+    """Extract (stage labels, timestamps or None) from a per-epoch stage series.
+
+    A series counts as stages when its key names it as one (e.g. "stages",
+    "hypnogram") or every label is a known sleep stage. Null or non-string
+    labels become "unknown" epochs so the timing of the night is kept.
+    """
+    if isinstance(value, dict):
+        value = value.get("values", value.get("data"))
+    if not isinstance(value, list) or not value:
+        return None
+    if all(isinstance(v, str) for v in value):
+        return (value, None) if _looks_like_stages(key, value) else None
+    if not isinstance(value[0], dict):
+        return None
+    label_key = next(
+        (k for k in _STAGE_LABEL_KEYS if any(isinstance(p, dict) and isinstance(p.get(k), str) for p in value)),
+        None,
+    )
+    if label_key is None:
+        return None
     try:
-        metrics = await client.get_metrics(email, date)
-        return {
-            "success": True,
-            "email": email,
-            "date": date,
-            "metrics": metrics
-        }
-    except httpx.HTTPStatusError as e:
-        return {
-            "success": False,
-            "error": f"HTTP {e.response.status_code}: {e.response.text}",
-            "email": email,
-            "date": date
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "email": email,
-            "date": date
-        }
+        labels = [point.get(label_key) for point in value]
+        timestamps = np.array([point["timestamp"] for point in value], dtype=np.float64)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+    if not len(timestamps) or not _looks_like_stages(key, labels):
+        return None
+    labels = [label if isinstance(label, str) else UNKNOWN_STAGE for label in labels]
+    if timestamps[0] > 1e12:
+        timestamps /= 1000.0
+    return labels, timestamps
+
+
+def encode_stages(
+    labels: List[str],
+    timestamps: Optional[np.ndarray] = None,
+    start: float = 0,
+    epoch_seconds: int = SLEEP_EPOCH_SECONDS,
+) -> Dict[str, Any]:
+    """Run-length encode a stage sequence into [stage, start, duration] segments with totals.
+
+    Without timestamps, epochs are assumed to be epoch_seconds long starting at
+    start. Efficiency is time in non-awake stages as a percentage of the
+    staged part of the night.
+    """
+    index: Dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(label, len(index)) for label in labels), dtype=np.int64, count=len(labels))
+    stages = list(index)
+    boundaries = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    first = np.concatenate(([0], boundaries))
+    last = np.concatenate((boundaries, [len(codes)]))
+    if timestamps is None:
+        seg_start = start + first * epoch_seconds
+        durations = (last - first) * epoch_seconds
+    else:
+        epoch = float(np.median(np.diff(timestamps))) if len(timestamps) > 1 else epoch_seconds
+        edges = np.append(timestamps, timestamps[-1] + epoch)
+        seg_start = timestamps[first]
+        durations = edges[last] - seg_start
+
+    seg_codes = codes[first]
+    totals = np.bincount(seg_codes, weights=durations, minlength=len(stages))
+    total = float(durations.sum())
+    awake = sum(float(totals[i]) for i, stage in enumerate(stages) if stage.lower() in AWAKE_STAGES)
+    # Epochs without a stage count towards neither sleep nor wake
+    total_staged = total - float(totals[index[UNKNOWN_STAGE]]) if UNKNOWN_STAGE in index else total
+    return {
+        "segments": [
+            [str(stages[c]), int(t), int(d)] for c, t, d in zip(seg_codes, seg_start, durations)
+        ],
+        "totals_seconds": {str(stage): int(totals[i]) for i, stage in enumerate(stages)},
+        "time_in_bed_seconds": int(total),
+        "efficiency_percent": round((total_staged - awake) / total_staged * 100, 1) if total_staged else None
+    }
+
+
+def _series_summary(values: np.ndarray) -> Dict[str, Any]:
+    return {
+        "samples": int(len(values)),
+        "mean": round(float(values.mean()), 2),
+        "min": round(float(values.min()), 2),
+        "max": round(float(values.max()), 2),
+        "nonzero": int(np.count_nonzero(values))
+    }
+
+
+def compact_sleep(sleep_data: Dict[str, Any], epoch_seconds: int = SLEEP_EPOCH_SECONDS) -> Dict[str, Any]:
+    """Replace per-epoch series in sleep_data with stage segments and numeric summaries"""
+    start = next((sleep_data[k] for k in _SLEEP_START_KEYS if _is_number(sleep_data.get(k))), 0)
+    compact = {}
+    for key, value in sleep_data.items():
+        stages = stage_series(value, key)
+        if stages is not None:
+            compact[key] = encode_stages(stages[0], stages[1], start, epoch_seconds)
+            continue
+        if isinstance(value, list) and value:
+            try:
+                numbers = np.asarray(value)
+            except (ValueError, TypeError):
+                # Ragged nested lists have no array shape
+                numbers = None
+            if numbers is not None and numbers.ndim == 1 and numbers.dtype.kind in "iuf":
+                compact[key] = _series_summary(numbers.astype(np.float64))
+                continue
+        series = series_arrays(value)
+        if series is not None:
+            compact[key] = _series_summary(series[1])
+            continue
+        compact[key] = value
+    return compact
 
 
 @mcp.tool
-async def get_sleep_data(email: str, date: str) -> Dict[str, Any]:
+async def get_sleep_data(email: str, date: str, compact: bool = False) -> Dict[str, Any]:
     """
     Get sleep-specific data for a user on a specific date.
     
     Args:
         email: User's email address
         date: Date in YYYY-MM-DD format
+        compact: Return stage sequences as run-length [stage, start, duration]
+            segments with per-stage totals and sleep efficiency, and other
+            per-epoch series (e.g. movement) as summaries
     
     Returns:
         Dictionary containing sleep metrics
     """
-    metrics = await get_user_metrics(email, date)
+    metrics = await fetch_user_metrics(email, date)
     
     if not metrics.get("success"):
         return metrics
     
-    sleep_data = metrics.get("metrics", {}).get("sleep_data", {})
+    with tracer.span("extract"):
+        sleep_data = metrics.get("metrics", {}).get("sleep_data", {})
+        if compact and isinstance(sleep_data, dict):
+            sleep_data = compact_sleep(sleep_data)
     return {
         "success": True,
         "email": email,
@@ -153,6 +954,83 @@ async def get_sleep_data(email: str, date: str) -> Dict[str, Any]:
     }
 
 
+@mcp.tool
+async def get_sleep_summary(
+    email: str,
+    start_date: str,
+    end_date: str,
+    include_segments: bool = False,
+) -> Dict[str, Any]:
+    """
+    Get compact sleep data for every night in a date range, e.g. for a weekly review.
+    
+    Args:
+        email: User's email address
+        start_date: First date in YYYY-MM-DD format
+        end_date: Last date in YYYY-MM-DD format (inclusive)
+        include_segments: Also include each night's [stage, start, duration] segments
+    
+    Returns:
+        Dictionary containing compact sleep data per night (stage totals,
+        efficiency and summaries), per-stage averages across nights, nights
+        without sleep data and days whose fetch failed. success is False when
+        no night has data, with the first error
+    """
+    if not ULTRAHUMAN_AUTH_KEY:
+        raise ValueError("ULTRAHUMAN_AUTH_KEY environment variable is required")
+
+    dates = parse_date_range(start_date, end_date)
+    results = await fetch_days([(email, d) for d in dates])
+
+    nights, missing_days, failed_days = [], [], []
+    stage_totals: Dict[str, float] = {}
+    staged_nights = 0
+    efficiencies = []
+    for date_str, metrics in zip(dates, results):
+        if isinstance(metrics, BaseException):
+            failed_days.append(date_str)
+            continue
+        sleep_data = metrics.get("sleep_data") if isinstance(metrics, dict) else None
+        if not isinstance(sleep_data, dict) or not sleep_data:
+            missing_days.append(date_str)
+            continue
+        night = compact_sleep(sleep_data)
+        for value in night.values():
+            if isinstance(value, dict) and "segments" in value:
+                staged_nights += 1
+                for stage, seconds in value["totals_seconds"].items():
+                    stage_totals[stage] = stage_totals.get(stage, 0) + seconds
+                if value["efficiency_percent"] is not None:
+                    efficiencies.append(value["efficiency_percent"])
+                if not include_segments:
+                    value["segment_count"] = len(value.pop("segments"))
+        nights.append({"date": date_str, "sleep_data": night})
+
+    if not nights:
+        return {
+            "success": False,
+            "error": first_error(results, "No sleep data in date range"),
+            "email": email,
+            "start_date": start_date,
+            "end_date": end_date,
+            "failed_days": failed_days
+        }
+
+    return {
+        "success": True,
+        "email": email,
+        "start_date": start_date,
+        "end_date": end_date,
+        "nights": nights,
+        "missing_days": missing_days,
+        "failed_days": failed_days,
+        "averages": {
+            "stage_seconds": {stage: round(total / staged_nights) for stage, total in stage_totals.items()},
+            "efficiency_percent": round(sum(efficiencies) / len(efficiencies), 1) if efficiencies else None
+        }
+    }
+
+
 @mcp.tool
 async def get_movement_data(email: str, date: str) -> Dict[str, Any]:
     """
@@ -165,16 +1043,17 @@ async def get_movement_data(email: str, date: str) -> Dict[str, Any]:
     Returns:
         Dictionary containing movement metrics including steps, movement index, etc.
     """
-    metrics = await get_user_metrics(email, date)
+    metrics = await fetch_user_metrics(email, date)
     
     if not metrics.get("success"):
         return metrics
     
-    movement_data = {
-        "steps": metrics.get("metrics", {}).get("steps"),
-        "movement_index": metrics.get("metrics", {}).get("movement_index"),
-        "movement_data": metrics.get("metrics", {}).get("movement_data", {})
-    }
+    with tracer.span("extract"):
+        movement_data = {
+            "steps": metrics.get("metrics", {}).get("steps"),
+            "movement_index": metrics.get("metrics", {}).get("movement_index"),
+            "movement_data": metrics.get("metrics", {}).get("movement_data", {})
+        }
     
     return {
         "success": True,
@@ -196,19 +1075,20 @@ async def get_glucose_metrics(email: str, date: str) -> Dict[str, Any]:
     Returns:
         Dictionary containing glucose metrics including glucose levels, variability, HbA1c, etc.
     """
-    metrics = await get_user_metrics(email, date)
+    metrics = await fetch_user_metrics(email, date)
     
     if not metrics.get("success"):
         return metrics
     
-    glucose_data = {
-        "glucose": metrics.get("metrics", {}).get("glucose"),
-        "glucose_variability": metrics.get("metrics", {}).get("glucose_variability"),
-        "average_glucose": metrics.get("metrics", {}).get("average_glucose"),
-        "hba1c": metrics.get("metrics", {}).get("hba1c"),
-        "time_in_target": metrics.get("metrics", {}).get("time_in_target"),
-        "metabolic_score": metrics.get("metrics", {}).get("metabolic_score")
-    }
+    with tracer.span("extract"):
+        glucose_data = {
+            "glucose": metrics.get("metrics", {}).get("glucose"),
+            "glucose_variability": metrics.get("metrics", {}).get("glucose_variability"),
+            "average_glucose": metrics.get("metrics", {}).get("average_glucose"),
+            "hba1c": metrics.get("metrics", {}).get("hba1c"),
+            "time_in_target": metrics.get("metrics", {}).get("time_in_target"),
+            "metabolic_score": metrics.get("metrics", {}).get("metabolic_score")
+        }
     
     return {
         "success": True,
@@ -230,17 +1110,18 @@ async def get_heart_metrics(email: str, date: str) -> Dict[str, Any]:
     Returns:
         Dictionary containing heart rate, HRV, and recovery metrics
     """
-    metrics = await get_user_metrics(email, date)
+    metrics = await fetch_user_metrics(email, date)
     
     if not metrics.get("success"):
         return metrics
     
-    heart_data = {
-        "heart_rate": metrics.get("metrics", {}).get("heart_rate"),
-        "hrv": metrics.get("metrics", {}).get("hrv"),
-        "recovery_index": metrics.get("metrics", {}).get("recovery_index"),
-        "vo2_max": metrics.get("metrics", {}).get("vo2_max")
-    }
+    with tracer.span("extract"):
+        heart_data = {
+            "heart_rate": metrics.get("metrics", {}).get("heart_rate"),
+            "hrv": metrics.get("metrics", {}).get("hrv"),
+            "recovery_index": metrics.get("metrics", {}).get("recovery_index"),
+            "vo2_max": metrics.get("metrics", {}).get("vo2_max")
+        }
     
     return {
         "success": True,
@@ -250,14 +1131,998 @@ async def get_heart_metrics(email: str, date: str) -> Dict[str, Any]:
     }
 
 
-@mcp.resource("ultrahuman://api-info")
-async def get_api_info() -> str:
-    """Get information about the Ultrahuman Partnership API"""
-    return """
-    Ultrahuman Partnership API Information
-    
-    The Partnership API gives you full access to the data generated by Ultrahuman devices.
-    
+# Standard consensus glucose bands in mg/dL as (name, low, high, bounds), where
+# bounds says which edges are inclusive: the 70-180 target range includes both
+DEFAULT_GLUCOSE_RANGES = (
+    ("very_low", 0.0, 54.0, "[)"),
+    ("low", 54.0, 70.0, "[)"),
+    ("in_range", 70.0, 180.0, "[]"),
+    ("high", 180.0, 250.0, "(]"),
+    ("very_high", 250.0, float("inf"), "()"),
+)
+
+AGP_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def _round_list(values: np.ndarray, digits: int = 1) -> List[Optional[float]]:
+    return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+
+def binned_percentiles(bins: np.ndarray, values: np.ndarray, n_bins: int, percentiles) -> Dict[int, np.ndarray]:
+    """Linear-interpolated percentiles of values within each bin, without a Python loop over bins"""
+    order = np.lexsort((values, bins))
+    sorted_values = values[order]
+    counts = np.bincount(bins, minlength=n_bins)
+    starts = np.cumsum(counts) - counts
+    empty = counts == 0
+    last = max(len(sorted_values) - 1, 0)
+    result = {}
+    for p in percentiles:
+        position = starts + (p / 100.0) * np.maximum(counts - 1, 0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        lower_values = sorted_values[np.clip(lower, 0, last)]
+        upper_values = sorted_values[np.clip(upper, 0, last)]
+        curve = lower_values + (upper_values - lower_values) * (position - lower)
+        curve[empty] = np.nan
+        result[p] = curve
+    return result
+
+
+def glucose_profile(
+    timestamps: np.ndarray,
+    values: np.ndarray,
+    bin_minutes: int = 15,
+    utc_offset_minutes: int = 0,
+    ranges=DEFAULT_GLUCOSE_RANGES,
+) -> Dict[str, Any]:
+    """Ambulatory glucose profile, time in ranges, CV and GMI from raw CGM samples"""
+    n_bins = 1440 // bin_minutes
+    minute_of_day = ((timestamps + utc_offset_minutes * 60) % 86400) // 60
+    bins = (minute_of_day // bin_minutes).astype(np.int64)
+    curves = binned_percentiles(bins, values, n_bins, AGP_PERCENTILES)
+
+    lows = np.array([low for _, low, _, _ in ranges])[:, None]
+    highs = np.array([high for _, _, high, _ in ranges])[:, None]
+    low_closed = np.array([bounds[0] == "[" for *_, bounds in ranges])[:, None]
+    high_closed = np.array([bounds[1] == "]" for *_, bounds in ranges])[:, None]
+    sample = values[None, :]
+    in_band = (
+        np.where(low_closed, sample >= lows, sample > lows)
+        & np.where(high_closed, sample <= highs, sample < highs)
+    )
+    time_in_ranges = in_band.mean(axis=1) * 100
+
+    mean = float(values.mean())
+    sd = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+    return {
+        "samples": int(len(values)),
+        "mean_glucose": round(mean, 1),
+        "sd": round(sd, 1),
+        "cv_percent": round(sd / mean * 100, 1) if mean else None,
+        "gmi_percent": round(3.31 + 0.02392 * mean, 2),
+        "time_in_ranges": {
+            name: round(float(pct), 1) for (name, *_), pct in zip(ranges, time_in_ranges)
+        },
+        "agp": {
+            "bin_minutes": bin_minutes,
+            "time_of_day": [f"{m // 60:02d}:{m % 60:02d}" for m in range(0, 1440, bin_minutes)],
+            **{f"p{p}": _round_list(curves[p]) for p in AGP_PERCENTILES},
+        },
+    }
+
+
+@mcp.tool
+async def get_glucose_profile(
+    email: str,
+    start_date: str,
+    end_date: str,
+    ranges: Optional[List[List[float]]] = None,
+    bin_minutes: int = 15,
+    utc_offset_minutes: int = 0,
+) -> Dict[str, Any]:
+    """
+    Compute an ambulatory glucose profile (AGP) from raw CGM data over a date range.
+    
+    Args:
+        email: User's email address
+        start_date: First date in YYYY-MM-DD format
+        end_date: Last date in YYYY-MM-DD format (inclusive)
+        ranges: Optional custom glucose bands as [low, high) pairs in mg/dL,
+            e.g. [[70, 140], [140, 180]]. Defaults to the standard consensus bands.
+        bin_minutes: Time-of-day bin width for the percentile curves (must divide 1440)
+        utc_offset_minutes: User's UTC offset, used to place samples by local time of day
+    
+    Returns:
+        Dictionary containing 5/25/50/75/95 percentile curves by time of day,
+        time in each range (%), mean glucose, SD, CV (%) and GMI (%), plus the
+        days without CGM data (missing_days) and the days whose fetch failed
+        (failed_days)
+    """
+    if not ULTRAHUMAN_AUTH_KEY:
+        raise ValueError("ULTRAHUMAN_AUTH_KEY environment variable is required")
+
+    dates = parse_date_range(start_date, end_date)
+    if bin_minutes <= 0 or 1440 % bin_minutes:
+        raise ValueError("bin_minutes must be a positive divisor of 1440")
+    if ranges is None:
+        bands = DEFAULT_GLUCOSE_RANGES
+    else:
+        if any(len(band) != 2 or band[0] >= band[1] for band in ranges):
+            raise ValueError("Each range must be a [low, high] pair with low < high")
+        bands = tuple((f"{low:g}-{high:g}", float(low), float(high), "[)") for low, high in ranges)
+
+    results = await fetch_days([(email, d) for d in dates])
+
+    timestamps, values, missing_days, failed_days = [], [], [], []
+    for date_str, metrics in zip(dates, results):
+        if isinstance(metrics, BaseException):
+            failed_days.append(date_str)
+            continue
+        series = series_arrays(metrics.get("glucose")) if isinstance(metrics, dict) else None
+        if series is None:
+            missing_days.append(date_str)
+            continue
+        timestamps.append(series[0])
+        values.append(series[1])
+
+    base = {"email": email, "start_date": start_date, "end_date": end_date}
+    if not values:
+        return {
+            "success": False,
+            "error": first_error(results, "No glucose data in date range"),
+            **base,
+            "failed_days": failed_days
+        }
+
+    profile = glucose_profile(
+        np.concatenate(timestamps), np.concatenate(values), bin_minutes, utc_offset_minutes, bands
+    )
+    return {
+        "success": True,
+        **base,
+        "days_with_data": len(values),
+        "missing_days": missing_days,
+        "failed_days": failed_days,
+        "glucose_profile": profile
+    }
+
+
+# Daily scalars surfaced by get_heart_metrics and get_sleep_data
+DEFAULT_ANOMALY_METRICS = ("hrv", "heart_rate", "recovery_index", "vo2_max", "sleep_data")
+
+
+def daily_value(metrics: Any, path: str) -> float:
+    """Resolve a dotted metric path to one number for the day (series are averaged)"""
+    value = metrics
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return np.nan
+        value = value.get(part)
+    if _is_number(value):
+        return float(value)
+    series = series_arrays(value)
+    if series is not None:
+        return float(series[1].mean())
+    if isinstance(value, list) and value and all(_is_number(v) for v in value):
+        return float(np.mean(value))
+    return np.nan
+
+
+def expand_metric_names(days: List[Dict[str, Any]], metrics) -> List[str]:
+    """Expand metric names that point at objects (e.g. "sleep_data") into their numeric fields"""
+    names = []
+    for name in metrics:
+        fields = {}
+        for day in days:
+            value = day
+            for part in name.split("."):
+                value = value.get(part) if isinstance(value, dict) else None
+            if isinstance(value, dict):
+                fields.update((f"{name}.{k}", None) for k, v in value.items() if _is_number(v))
+        names.extend(fields or [name])
+    return names
+
+
+def daily_metric_matrix(days: List[Any], metrics) -> Tuple[List[str], np.ndarray]:
+    """Build an aligned day x metric matrix; missing days and values are NaN"""
+    present = [day for day in days if isinstance(day, dict)]
+    names = expand_metric_names(present, metrics)
+    matrix = np.full((len(days), len(names)), np.nan)
+    for i, day in enumerate(days):
+        if isinstance(day, dict):
+            matrix[i] = [daily_value(day, name) for name in names]
+    return names, matrix
+
+
+def _prefix_sums(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    zero = np.zeros((1, values.shape[1]))
+    return (
+        np.vstack([zero, np.cumsum(valid, axis=0)]),
+        np.vstack([zero, np.cumsum(filled, axis=0)]),
+        np.vstack([zero, np.cumsum(filled ** 2, axis=0)]),
+    )
+
+
+def _window_stats(prefix, lo: np.ndarray, hi: np.ndarray, min_periods: int):
+    """Mean, variance and count over rows [lo, hi) for every day at once"""
+    count_sums, value_sums, square_sums = prefix
+    n = count_sums[hi] - count_sums[lo]
+    total = value_sums[hi] - value_sums[lo]
+    squares = square_sums[hi] - square_sums[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / n
+        var = (squares - n * mean ** 2) / (n - 1)
+    enough = n >= min_periods
+    return np.where(enough, mean, np.nan), np.where(enough, np.maximum(var, 0.0), np.nan), n
+
+
+def rolling_anomalies(
+    values: np.ndarray,
+    window: int = 14,
+    ewma_span: int = 7,
+) -> Dict[str, np.ndarray]:
+    """Vectorized rolling baselines for a day x metric matrix.
+
+    Every statistic for day t uses only days before t, so a day is always
+    compared against its own history.
+    """
+    days = values.shape[0]
+    index = np.arange(days)
+    min_periods = max(3, window // 2)
+    prefix = _prefix_sums(values)
+
+    # Trailing window z-scores
+    mean, var, before_n = _window_stats(prefix, np.maximum(index - window, 0), index, min_periods)
+    std = np.sqrt(var)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z_score = np.where(std > 0, (values - mean) / std, np.nan)
+
+    # EWMA baseline as a weighted sum over prior days (weights decay with age)
+    alpha = 2.0 / (ewma_span + 1)
+    age = index[:, None] - 1 - index[None, :]
+    weights = np.where(age >= 0, (1 - alpha) ** np.maximum(age, 0), 0.0)
+    valid = ~np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ewma = (weights @ np.where(valid, values, 0.0)) / (weights @ valid)
+
+    # Change points: Welch t-statistic between the windows before and after each day
+    after_mean, after_var, after_n = _window_stats(prefix, index, np.minimum(index + window, days), min_periods)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        change_score = (after_mean - mean) / np.sqrt(var / before_n + after_var / after_n)
+
+    return {
+        "mean": mean,
+        "std": std,
+        "z_score": z_score,
+        "ewma": ewma,
+        "after_mean": after_mean,
+        "change_score": change_score,
+    }
+
+
+def linear_trends(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Least-squares slope per day and mean for every metric column, ignoring NaNs"""
+    valid = ~np.isnan(values)
+    x = np.where(valid, np.arange(values.shape[0])[:, None], 0.0)
+    y = np.where(valid, values, 0.0)
+    n = valid.sum(axis=0)
+    sx, sy = x.sum(axis=0), y.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (n * (x * y).sum(axis=0) - sx * sy) / (n * (x ** 2).sum(axis=0) - sx ** 2)
+        mean = sy / n
+    return slope, mean
+
+
+def _num(value: float, digits: int = 2) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+@mcp.tool
+async def detect_anomalies(
+    email: str,
+    start_date: str,
+    end_date: str,
+    metrics: Optional[List[str]] = None,
+    window: int = 14,
+    z_threshold: float = 2.5,
+    ewma_span: int = 7,
+    change_threshold: float = 4.0,
+) -> Dict[str, Any]:
+    """
+    Detect anomalous days, change points and trends in daily metrics over a date range.
+    
+    Args:
+        email: User's email address
+        start_date: First date in YYYY-MM-DD format
+        end_date: Last date in YYYY-MM-DD format (inclusive)
+        metrics: Metric names to analyse (default: hrv, heart_rate, recovery_index,
+            vo2_max and every numeric field of sleep_data). Nested fields use dots,
+            e.g. "sleep_data.score". Intraday series are averaged per day.
+        window: Number of prior days in the rolling baseline
+        z_threshold: Flag days whose rolling z-score magnitude reaches this value
+        ewma_span: Span in days of the exponentially weighted baseline
+        change_threshold: Minimum |t| between the windows before and after a day
+            for it to be reported as a change point
+    
+    Returns:
+        Dictionary containing only the flagged days with their deviations,
+        detected change points, the per-metric linear trend and the days whose
+        fetch failed. success is False when no day has data, with the first error
+    """
+    if not ULTRAHUMAN_AUTH_KEY:
+        raise ValueError("ULTRAHUMAN_AUTH_KEY environment variable is required")
+
+    dates = parse_date_range(start_date, end_date)
+    if window < 2:
+        raise ValueError("window must be at least 2 days")
+
+    results = await fetch_days([(email, d) for d in dates])
+    names, values = daily_metric_matrix(results, metrics or DEFAULT_ANOMALY_METRICS)
+    days_with_data = int((~np.isnan(values)).any(axis=1).sum())
+    if not days_with_data:
+        # Without this an auth error or outage would read as "no anomalies"
+        return {
+            "success": False,
+            "error": first_error(results, "No metric data in date range"),
+            "email": email,
+            "start_date": start_date,
+            "end_date": end_date,
+            "failed_days": failed_dates(dates, results)
+        }
+    stats = rolling_anomalies(values, window, ewma_span)
+    slope, mean = linear_trends(values)
+
+    z_score = stats["z_score"]
+    with np.errstate(invalid="ignore"):
+        flagged = np.abs(z_score) >= z_threshold
+        score = np.abs(stats["change_score"])
+        # Report a change point only at the peak of its score
+        padded = np.pad(score, ((1, 1), (0, 0)), constant_values=-np.inf)
+        is_peak = (score >= padded[:-2]) & (score > padded[2:])
+        change_points = (score >= change_threshold) & is_peak
+
+    flagged_days = []
+    for row in np.flatnonzero(flagged.any(axis=1)):
+        anomalies = []
+        for col in np.flatnonzero(flagged[row]):
+            ewma = stats["ewma"][row, col]
+            anomalies.append({
+                "metric": names[col],
+                "value": _num(values[row, col]),
+                "baseline_mean": _num(stats["mean"][row, col]),
+                "baseline_std": _num(stats["std"][row, col]),
+                "z_score": _num(z_score[row, col]),
+                "ewma_baseline": _num(ewma),
+                "ewma_deviation_pct": _num((values[row, col] - ewma) / ewma * 100) if ewma else None
+            })
+        flagged_days.append({"date": dates[row], "anomalies": anomalies})
+
+    return {
+        "success": True,
+        "email": email,
+        "start_date": start_date,
+        "end_date": end_date,
+        "metrics": names,
+        "days_with_data": days_with_data,
+        "failed_days": failed_dates(dates, results),
+        "flagged_days": flagged_days,
+        "change_points": [
+            {
+                "date": dates[row],
+                "metric": names[col],
+                "before_mean": _num(stats["mean"][row, col]),
+                "after_mean": _num(stats["after_mean"][row, col]),
+                "t_score": _num(stats["change_score"][row, col])
+            }
+            for row, col in zip(*np.nonzero(change_points))
+        ],
+        "trends": {
+            name: {"mean": _num(mean[i]), "slope_per_day": _num(slope[i], 4)}
+            for i, name in enumerate(names)
+        }
+    }
+
+
+DEFAULT_CORRELATION_METRICS = ("sleep_data", "hrv", "recovery_index", "steps", "average_glucose", "temperature")
+
+
+def pairwise_correlation(a: np.ndarray, b: np.ndarray, min_overlap: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """Pearson correlation of every column of a with every column of b.
+
+    Each pair uses only the rows where both values are present; pairs with
+    fewer than min_overlap shared rows are NaN. Returns (r, overlap counts).
+    """
+    mask_a, mask_b = ~np.isnan(a), ~np.isnan(b)
+    x, y = np.where(mask_a, a, 0.0), np.where(mask_b, b, 0.0)
+    ma, mb = mask_a.astype(np.float64), mask_b.astype(np.float64)
+    n = ma.T @ mb
+    sum_x, sum_y = x.T @ mb, ma.T @ y
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = x.T @ y - sum_x * sum_y / n
+        var_x = (x ** 2).T @ mb - sum_x ** 2 / n
+        var_y = ma.T @ (y ** 2) - sum_y ** 2 / n
+        r = cov / np.sqrt(var_x * var_y)
+    r[(n < min_overlap) | ~np.isfinite(r)] = np.nan
+    return np.clip(r, -1.0, 1.0), n.astype(np.int64)
+
+
+def lagged_correlations(values: np.ndarray, lags, min_overlap: int = 5) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """Correlation of metric i on day t with metric j on day t + lag, for each lag"""
+    days = values.shape[0]
+    result = {}
+    for lag in lags:
+        if lag >= days:
+            empty = np.full((values.shape[1], values.shape[1]), np.nan)
+            result[lag] = (empty, np.zeros_like(empty, dtype=np.int64))
+        else:
+            result[lag] = pairwise_correlation(values[:days - lag], values[lag:], min_overlap)
+    return result
+
+
+@mcp.tool
+async def analyze_correlations(
+    email: str,
+    start_date: str,
+    end_date: str,
+    metrics: Optional[List[str]] = None,
+    lags: Optional[List[int]] = None,
+    min_overlap: int = 5,
+    top: int = 10,
+) -> Dict[str, Any]:
+    """
+    Correlate daily metrics with each other, same-day and across day lags.
+    
+    Answers questions like "does late sleep hurt next-day HRV?" by correlating
+    metric A on day t with metric B on day t + lag over the whole range.
+    
+    Args:
+        email: User's email address
+        start_date: First date in YYYY-MM-DD format
+        end_date: Last date in YYYY-MM-DD format (inclusive)
+        metrics: Metric names (default: every numeric sleep_data field, hrv,
+            recovery_index, steps, average_glucose, temperature). Nested fields
+            use dots; intraday series are averaged per day.
+        lags: Day lags to compute (default [0, 1])
+        min_overlap: Minimum number of days with both values for a correlation
+        top: Number of strongest pairs to list
+    
+    Returns:
+        Dictionary containing a Pearson correlation matrix and day-overlap
+        matrix per lag (rows lead, columns follow), the strongest pairs and
+        the days whose fetch failed. success is False when no day has data,
+        with the first error
+    """
+    if not ULTRAHUMAN_AUTH_KEY:
+        raise ValueError("ULTRAHUMAN_AUTH_KEY environment variable is required")
+
+    dates = parse_date_range(start_date, end_date)
+    lags = sorted(set(lags)) if lags else [0, 1]
+    if lags[0] < 0:
+        raise ValueError("lags must not be negative")
+
+    results = await fetch_days([(email, d) for d in dates])
+    names, values = daily_metric_matrix(results, metrics or DEFAULT_CORRELATION_METRICS)
+    days_with_data = int((~np.isnan(values)).any(axis=1).sum())
+    if not days_with_data:
+        return {
+            "success": False,
+            "error": first_error(results, "No metric data in date range"),
+            "email": email,
+            "start_date": start_date,
+            "end_date": end_date,
+            "failed_days": failed_dates(dates, results)
+        }
+    correlations = lagged_correlations(values, lags, min_overlap)
+
+    pairs = []
+    for lag, (r, n) in correlations.items():
+        rows, cols = np.nonzero(~np.isnan(r))
+        for row, col in zip(rows, cols):
+            # Same-day matrices are symmetric with a trivial diagonal
+            if lag == 0 and row >= col:
+                continue
+            pairs.append((abs(r[row, col]), lag, row, col))
+    pairs.sort(key=lambda p: p[0], reverse=True)
+
+    return {
+        "success": True,
+        "email": email,
+        "start_date": start_date,
+        "end_date": end_date,
+        "metrics": names,
+        "days_with_data": days_with_data,
+        "failed_days": failed_dates(dates, results),
+        "correlations": {
+            str(lag): {
+                "r": [[_num(v, 3) for v in row] for row in r],
+                "n": n.tolist()
+            }
+            for lag, (r, n) in correlations.items()
+        },
+        "strongest": [
+            {
+                "lead": names[row],
+                "follow": names[col],
+                "lag_days": lag,
+                "r": _num(correlations[lag][0][row, col], 3),
+                "n": int(correlations[lag][1][row, col])
+            }
+            for _, lag, row, col in pairs[:top]
+        ]
+    }
+
+
+# Daily scalars surfaced by the sleep, movement, glucose and heart tools
+DEFAULT_COHORT_METRICS = (
+    "hrv", "recovery_index", "vo2_max", "steps", "movement_index", "average_glucose",
+    "glucose_variability", "hba1c", "time_in_target", "metabolic_score", "sleep_data",
+)
+COHORT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def member_means(days: List[Any], metrics) -> Tuple[Dict[str, float], int]:
+    """Average each daily metric over one member's days; returns (means, days with data)"""
+    names, values = daily_metric_matrix(days, metrics)
+    present = ~np.isnan(values)
+    counts = present.sum(axis=0)
+    totals = np.where(present, values, 0.0).sum(axis=0)
+    means = {name: totals[i] / counts[i] for i, name in enumerate(names) if counts[i]}
+    return means, int(present.any(axis=1).sum())
+
+
+def percentile_ranks(values: np.ndarray) -> np.ndarray:
+    """Percentile rank of every value within its column, ties counted as half below.
+
+    Ranks are computed for all members of a column at once with a sort and two
+    binary searches; missing (NaN) values stay NaN and don't count.
+    """
+    ranks = np.full(values.shape, np.nan)
+    for col in range(values.shape[1]):
+        column = values[:, col]
+        present = ~np.isnan(column)
+        cohort = np.sort(column[present])
+        if not len(cohort):
+            continue
+        below = np.searchsorted(cohort, column[present], side="left")
+        at_or_below = np.searchsorted(cohort, column[present], side="right")
+        ranks[present, col] = (below + at_or_below) / (2 * len(cohort)) * 100
+    return ranks
+
+
+def cohort_summary(values: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-column distribution summary of a member x metric matrix"""
+    present = ~np.isnan(values)
+    with warnings.catch_warnings():
+        # All-NaN columns summarize to NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        percentiles = np.nanpercentile(values, COHORT_PERCENTILES, axis=0)
+        return {
+            "n": present.sum(axis=0),
+            "mean": np.nanmean(values, axis=0),
+            "std": np.nanstd(values, axis=0),
+            "min": np.nanmin(values, axis=0),
+            **{f"p{p}": row for p, row in zip(COHORT_PERCENTILES, percentiles)},
+            "max": np.nanmax(values, axis=0),
+        }
+
+
+@mcp.tool
+async def get_cohort_percentiles(
+    emails: List[str],
+    start_date: str,
+    end_date: str,
+    metrics: Optional[List[str]] = None,
+    members: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Rank cohort members against each other on their daily metrics over a date range.
+    
+    Each member's metrics are averaged over the days they have data, giving a
+    member x metric matrix from which percentile ranks and cohort
+    distributions are computed. Days are fetched concurrently across the
+    whole cohort under one shared limit.
+    
+    Args:
+        emails: Email addresses of the cohort members
+        start_date: First date in YYYY-MM-DD format
+        end_date: Last date in YYYY-MM-DD format (inclusive)
+        metrics: Metric names to rank (default: the scalar metrics of the sleep,
+            movement, glucose and heart tools, with every numeric sleep_data
+            field). Nested fields use dots; intraday series are averaged per day.
+        members: Only return ranks for these emails (default: every member);
+            the cohort distribution always covers everyone
+    
+    Returns:
+        Dictionary containing each member's metric averages and percentile
+        ranks (0-100, aligned with "metrics"), the cohort distribution summary
+        per metric, and the members without any data with their failed-day
+        count and first fetch error. success is False when no member has data
+    """
+    if not ULTRAHUMAN_AUTH_KEY:
+        raise ValueError("ULTRAHUMAN_AUTH_KEY environment variable is required")
+
+    emails = list(dict.fromkeys(emails))
+    if not emails:
+        raise ValueError("emails must not be empty")
+    if len(emails) > MAX_COHORT_SIZE:
+        raise ValueError(f"Cohort must not exceed {MAX_COHORT_SIZE} members")
+    dates = parse_date_range(start_date, end_date)
+    unknown = set(members or ()) - set(emails)
+    if unknown:
+        raise ValueError(f"members not in the cohort: {', '.join(sorted(unknown))}")
+
+    semaphore = asyncio.Semaphore(COHORT_CONCURRENCY)
+
+    async def summarize(email: str) -> Dict[str, Any]:
+        days = await fetch_days([(email, d) for d in dates], semaphore=semaphore, store=False)
+        means, days_with_data = member_means(days, metrics or DEFAULT_COHORT_METRICS)
+        errors = [day for day in days if isinstance(day, BaseException)]
+        return {
+            "means": means,
+            "days_with_data": days_with_data,
+            "failed_days": len(errors),
+            "error": fetch_error(errors[0]) if errors else None
+        }
+
+    results = await asyncio.gather(*(summarize(email) for email in emails))
+    without_data = [
+        {"email": email, "failed_days": result["failed_days"], "error": result["error"]}
+        for email, result in zip(emails, results)
+        if not result["days_with_data"]
+    ]
+    base = {"start_date": start_date, "end_date": end_date, "cohort_size": len(emails)}
+    if len(without_data) == len(emails):
+        # Every member failed or had nothing: surface why instead of an empty ranking
+        return {
+            "success": False,
+            "error": next((m["error"] for m in without_data if m["error"]), "No metric data in date range"),
+            **base,
+            "members_without_data": without_data
+        }
+
+    names = list(dict.fromkeys(name for result in results for name in result["means"]))
+    columns = {name: i for i, name in enumerate(names)}
+    values = np.full((len(emails), len(names)), np.nan)
+    for row, result in enumerate(results):
+        for name, mean in result["means"].items():
+            values[row, columns[name]] = mean
+    ranks = percentile_ranks(values)
+    summary = cohort_summary(values)
+
+    selected = set(members or emails)
+    return {
+        "success": True,
+        **base,
+        "metrics": names,
+        "distribution": {
+            name: {key: int(stat[i]) if key == "n" else _num(stat[i]) for key, stat in summary.items()}
+            for i, name in enumerate(names)
+        },
+        "members": [
+            {
+                "email": email,
+                "days_with_data": result["days_with_data"],
+                "failed_days": result["failed_days"],
+                "values": [_num(v) for v in values[row]],
+                "percentile_ranks": [_num(r, 1) for r in ranks[row]]
+            }
+            for row, (email, result) in enumerate(zip(emails, results))
+            if email in selected and result["days_with_data"]
+        ],
+        "members_without_data": without_data
+    }
+
+
+def flatten_scalars(value: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """Flatten nested dicts into dotted scalar columns, dropping lists (intraday series)"""
+    flat = {}
+    for key, item in value.items():
+        name = f"{prefix}{key}"
+        if isinstance(item, dict):
+            flat.update(flatten_scalars(item, f"{name}."))
+        elif item is None or isinstance(item, (str, int, float, bool)):
+            flat[name] = item
+    return flat
+
+
+def _append_bytes(path: str, data: bytes) -> int:
+    with open(path, "ab") as f:
+        f.write(data)
+        return f.tell()
+
+
+class _NdjsonExport:
+    """One JSON line per user-day with the full metrics payload"""
+
+    def __init__(self, path: str, state: Dict[str, Any]):
+        self.path = path
+        self.bytes = state.get("bytes", 0)
+        # Drop anything written after the last checkpoint
+        with open(path, "ab") as f:
+            f.truncate(self.bytes)
+
+    def row(self, email: str, date_str: str, metrics: Any) -> Dict[str, Any]:
+        return {"email": email, "date": date_str, "metrics": metrics}
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        data = b"".join(json.dumps(row, separators=(",", ":")).encode() + b"\n" for row in rows)
+        self.bytes = _append_bytes(self.path, data)
+
+    def state(self) -> Dict[str, Any]:
+        return {"bytes": self.bytes}
+
+    def commit(self) -> None:
+        pass
+
+
+def _csv_header(path: str) -> Optional[List[str]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), None)
+
+
+class _CsvExport:
+    """Flattened scalar columns; columns first seen in a later batch widen the header.
+
+    Widening rewrites the file (streamed, earlier rows left blank in the new
+    columns) into a side file that only replaces the export once the
+    checkpoint covering it has been saved.
+    """
+
+    def __init__(self, path: str, state: Dict[str, Any]):
+        self.path = path
+        self.rewrite_path = f"{path}.rewrite"
+        self.bytes = state.get("bytes", 0)
+        self.columns = state.get("columns")
+        self.rewritten = False
+        if os.path.exists(self.rewrite_path):
+            # Interrupted between checkpoint and swap: the rewrite is the checkpointed file.
+            # Otherwise it belongs to a batch that was never checkpointed.
+            if state.get("rewritten") and _csv_header(self.rewrite_path) == self.columns:
+                os.replace(self.rewrite_path, path)
+            else:
+                os.remove(self.rewrite_path)
+        with open(path, "ab") as f:
+            f.truncate(self.bytes)
+
+    def row(self, email: str, date_str: str, metrics: Any) -> Dict[str, Any]:
+        return {"email": email, "date": date_str, **flatten_scalars(metrics if isinstance(metrics, dict) else {})}
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        buffer = io.StringIO()
+        names = list(dict.fromkeys(key for row in rows for key in row))
+        if self.columns is None:
+            self.columns = names
+            csv.writer(buffer).writerow(self.columns)
+        known = set(self.columns)
+        added = [name for name in names if name not in known]
+        self.columns = self.columns + added
+        csv.DictWriter(buffer, self.columns).writerows(rows)
+        if added:
+            self._rewrite(len(added), buffer.getvalue())
+        else:
+            self.bytes = _append_bytes(self.path, buffer.getvalue().encode())
+
+    def _rewrite(self, padding: int, tail: str) -> None:
+        with open(self.path, newline="", encoding="utf-8") as src, \
+                open(self.rewrite_path, "w", newline="", encoding="utf-8") as dst:
+            reader, writer = csv.reader(src), csv.writer(dst)
+            next(reader, None)
+            writer.writerow(self.columns)
+            for record in reader:
+                writer.writerow(record + [""] * padding)
+            dst.write(tail)
+        self.bytes = os.path.getsize(self.rewrite_path)
+        self.rewritten = True
+
+    def state(self) -> Dict[str, Any]:
+        return {"bytes": self.bytes, "columns": self.columns, "rewritten": self.rewritten}
+
+    def commit(self) -> None:
+        """Swap in a rewritten file once the checkpoint covering it is saved"""
+        if self.rewritten:
+            os.replace(self.rewrite_path, self.path)
+            self.rewritten = False
+
+
+def _load_pyarrow() -> None:
+    global pa, pq
+    if not PYARROW_AVAILABLE:
+        raise ValueError("Parquet export requires the pyarrow package")
+    if pa is None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+
+class _ParquetExport:
+    """Columnar part files in a dataset directory, one per batch.
+
+    Each part has the columns of its own batch. A column's type is fixed by
+    its first non-null value ("null" until then), so the parts always unify;
+    the unified schema is kept in _common_metadata for readers.
+    """
+
+    def __init__(self, path: str, state: Dict[str, Any]):
+        _load_pyarrow()
+        self.path = path
+        self.parts = state.get("parts", 0)
+        self.fields: Dict[str, str] = dict(state.get("fields", {}))
+        os.makedirs(path, exist_ok=True)
+
+    def _part(self, index: int) -> str:
+        return os.path.join(self.path, f"part-{index:05d}.parquet")
+
+    row = _CsvExport.row
+
+    def _update_fields(self, rows: List[Dict[str, Any]]) -> List[str]:
+        """Record the type of every new column; returns the batch's columns"""
+        names = {}
+        for row in rows:
+            for key, value in row.items():
+                names[key] = None
+                if self.fields.get(key, "null") != "null":
+                    continue
+                if value is None:
+                    self.fields[key] = "null"
+                elif isinstance(value, str):
+                    self.fields[key] = "string"
+                elif isinstance(value, bool):
+                    self.fields[key] = "bool"
+                else:
+                    self.fields[key] = "double"
+        return list(names)
+
+    def schema(self, names=None):
+        return pa.schema([(name, pa.type_for_alias(self.fields[name])) for name in (names or self.fields)])
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        schema = self.schema(self._update_fields(rows))
+        columns = {}
+        for field in schema:
+            values = [row.get(field.name) for row in rows]
+            if pa.types.is_string(field.type):
+                columns[field.name] = [None if v is None else str(v) for v in values]
+            elif pa.types.is_boolean(field.type):
+                columns[field.name] = [v if isinstance(v, bool) else None for v in values]
+            else:
+                columns[field.name] = [float(v) if _is_number(v) else None for v in values]
+        pq.write_table(pa.table(columns, schema=schema), self._part(self.parts))
+        pq.write_metadata(self.schema(), os.path.join(self.path, "_common_metadata"))
+        self.parts += 1
+
+    def state(self) -> Dict[str, Any]:
+        return {"parts": self.parts, "fields": self.fields}
+
+    def commit(self) -> None:
+        pass
+
+
+# Failed user-days kept (with their errors) in the checkpoint and the result
+EXPORT_FAILED_SAMPLE = 20
+
+EXPORT_WRITERS = {"ndjson": _NdjsonExport, "csv": _CsvExport, "parquet": _ParquetExport}
+
+
+def _save_checkpoint(path: str, checkpoint: Dict[str, Any]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+@mcp.tool
+async def export_history(
+    emails: List[str],
+    start_date: str,
+    end_date: str,
+    filename: str,
+    format: str = "ndjson",
+    resume: bool = True,
+) -> Dict[str, Any]:
+    """
+    Export the metric history of one or more users to a file on the server.
+    
+    Days are fetched in small batches with bounded concurrency and written as
+    they arrive, so memory use does not grow with the range. Progress is
+    checkpointed after every batch and an interrupted export is resumed by
+    calling the tool again with the same arguments.
+    
+    Args:
+        emails: User email addresses to export
+        start_date: First date in YYYY-MM-DD format
+        end_date: Last date in YYYY-MM-DD format (inclusive)
+        filename: Output file name inside the server's export directory
+        format: "ndjson" (full payloads, one line per user-day), "csv"
+            (flattened scalar metrics) or "parquet" (flattened scalar metrics
+            as a directory of part files; read them with the schema in its
+            _common_metadata file, since later parts may add columns)
+        resume: Continue a previous export of the same file; if false, any
+            existing file is overwritten
+    
+    Returns:
+        Dictionary containing the output path, days written, and the number
+        of days that could not be fetched with the first few of them
+    """
+    if not ULTRAHUMAN_AUTH_KEY:
+        raise ValueError("ULTRAHUMAN_AUTH_KEY environment variable is required")
+    if format not in EXPORT_WRITERS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_WRITERS)}")
+    if not filename or os.path.basename(filename) != filename or filename in (".", ".."):
+        raise ValueError("filename must be a plain file name")
+    if not emails:
+        raise ValueError("At least one email is required")
+
+    start, days = parse_date_bounds(start_date, end_date, max_days=None)
+    total = len(emails) * days
+
+    def task(index: int) -> Tuple[str, str]:
+        # User-days are generated per batch rather than listed up front
+        email_index, day = divmod(index, days)
+        return emails[email_index], (start + timedelta(days=day)).isoformat()
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, filename)
+    checkpoint_path = f"{path}.checkpoint.json"
+    export = {"emails": emails, "start_date": start_date, "end_date": end_date, "format": format}
+
+    checkpoint = None
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("export") != export:
+            raise ValueError("An export with different arguments exists for this file; use resume=false to overwrite")
+    if checkpoint is None:
+        checkpoint = {"export": export, "completed": 0, "failed_count": 0, "failed": [], "state": {}}
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                os.remove(os.path.join(path, name))
+        elif os.path.exists(path):
+            os.remove(path)
+
+    resumed_from = checkpoint["completed"]
+    writer = EXPORT_WRITERS[format](path, checkpoint["state"])
+
+    for offset in range(resumed_from, total, EXPORT_BATCH_DAYS):
+        batch = [task(i) for i in range(offset, min(offset + EXPORT_BATCH_DAYS, total))]
+        results = await fetch_days(batch, use_cache=False, store=False)
+        rows = []
+        for (email, date_str), metrics in zip(batch, results):
+            if isinstance(metrics, Exception):
+                # Count every failure but keep only a sample, so the checkpoint stays small
+                checkpoint["failed_count"] += 1
+                if len(checkpoint["failed"]) < EXPORT_FAILED_SAMPLE:
+                    checkpoint["failed"].append({"email": email, "date": date_str, "error": fetch_error(metrics)})
+            else:
+                rows.append(writer.row(email, date_str, metrics))
+        if rows:
+            await asyncio.to_thread(writer.write, rows)
+        checkpoint["completed"] = offset + len(batch)
+        checkpoint["state"] = writer.state()
+        _save_checkpoint(checkpoint_path, checkpoint)
+        writer.commit()
+
+    return {
+        "success": True,
+        "path": os.path.abspath(path),
+        "format": format,
+        "days_total": total,
+        "days_written": total - checkpoint["failed_count"],
+        "resumed_from": resumed_from,
+        "days_failed": checkpoint["failed_count"],
+        "failed": checkpoint["failed"]
+    }
+
+
+@mcp.resource("ultrahuman://api-info")
+async def get_api_info() -> str:
+    """Get information about the Ultrahuman Partnership API"""
+    return """
+    Ultrahuman Partnership API Information
+    
+    The Partnership API gives you full access to the data generated by Ultrahuman devices.
+    
     Available Metrics:
     1. Sleep Data - Sleep patterns, quality, duration
     2. Movement Data - Activity levels, movement patterns
@@ -285,7 +2150,458 @@ async def get_api_info() -> str:
     """
 
 
+class TracingMiddleware(MCPMiddleware):
+    """Opens the root span of every tool call"""
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        name = context.message.name
+        with tracer.trace(f"tools/call {name}", **{"mcp.tool.name": name}) as root:
+            result = await call_next(context)
+            # After the tool body's last span, FastMCP is converting the result
+            ends = [span.end_ns for span in root.trace.spans if span is not root and span.end_ns]
+            if ends:
+                tracer.record("fastmcp.serialize", max(ends), time.time_ns())
+            return result
+
+
+mcp.add_middleware(TracingMiddleware())
+
+
+def slow_requests_report() -> Dict[str, Any]:
+    return {"size": tracer.slow_log.size, "requests": tracer.slow_log.snapshot()}
+
+
+@mcp.resource("ultrahuman://debug/slow-requests", mime_type="application/json")
+async def get_slow_requests() -> Dict[str, Any]:
+    """Slowest recent tool calls with their per-phase span breakdown"""
+    return slow_requests_report()
+
+
+@mcp.custom_route("/debug/slow-requests", methods=["GET"])
+async def slow_requests_route(request: Request) -> JSONResponse:
+    # Off unless a token is configured, and then only with that bearer token
+    authorization = request.headers.get("authorization", "")
+    if not DEBUG_TOKEN or not secrets.compare_digest(authorization.encode(), f"Bearer {DEBUG_TOKEN}".encode()):
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    return JSONResponse(slow_requests_report())
+
+def diff_metrics(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """Structural diff between two metric payloads.
+
+    Returns a list of changes, each with a dotted path and one of the ops
+    "add", "remove", "replace" or "append" (new points on an intraday series).
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key, value in new.items():
+            child = f"{path}.{key}" if path else key
+            if key not in old:
+                changes.append({"path": child, "op": "add", "value": value})
+            else:
+                changes.extend(diff_metrics(old[key], value, child))
+        for key in old:
+            if key not in new:
+                changes.append({"path": f"{path}.{key}" if path else key, "op": "remove"})
+        return changes
+    if isinstance(old, list) and isinstance(new, list) and len(new) > len(old) and new[:len(old)] == old:
+        return [{"path": path, "op": "append", "value": new[len(old):]}]
+    if old != new:
+        return [{"path": path, "op": "replace", "value": new}]
+    return []
+
+
+def parse_metrics_uri(uri: str) -> Optional[Tuple[str, str]]:
+    """Split an ultrahuman://{email}/{date} resource URI into (email, date)"""
+    prefix = "ultrahuman://"
+    if not uri.startswith(prefix):
+        return None
+    email, _, date_str = uri[len(prefix):].partition("/")
+    if not email or not date_str:
+        return None
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return None
+    return email, date_str
+
+
+class _Watch:
+    """State shared by every subscriber of one ultrahuman://{email}/{date} resource"""
+
+    __slots__ = ("uri", "email", "date", "sessions", "snapshot", "changes", "updated_at", "task")
+
+    def __init__(self, uri: str, email: str, date_str: str):
+        self.uri = uri
+        self.email = email
+        self.date = date_str
+        self.sessions: Set[Any] = set()
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.changes: List[Dict[str, Any]] = []
+        self.updated_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class MetricsWatcher:
+    """Runs one upstream poller per watched user-day, shared by all subscribers.
+
+    Each poll is diffed against the previous snapshot and subscribers are
+    notified only when something actually changed; reads of a watched
+    resource are served from the snapshot without another upstream request.
+    """
+
+    def __init__(self, interval: int = 60):
+        self.interval = interval
+        self._watches: Dict[str, _Watch] = {}
+
+    async def subscribe(self, uri: str, session: Any) -> None:
+        parsed = parse_metrics_uri(uri)
+        if parsed is None:
+            return
+        # The first timezone to reach a date is UTC+14
+        latest = (datetime.now(timezone.utc) + timedelta(hours=14)).date().isoformat()
+        if parsed[1] > latest:
+            raise ValueError("Cannot subscribe to a date that hasn't started yet")
+        if time.time() >= day_settled_at(parsed[1]):
+            # Settled days never change, so there is nothing to watch
+            return
+        watch = self._watches.get(uri)
+        if watch is None:
+            watch = self._watches[uri] = _Watch(uri, *parsed)
+        watch.sessions.add(session)
+        if watch.task is None or watch.task.done():
+            watch.task = asyncio.create_task(self._poll(watch))
+
+    async def unsubscribe(self, uri: str, session: Any) -> None:
+        watch = self._watches.get(uri)
+        if watch is None:
+            return
+        watch.sessions.discard(session)
+        if not watch.sessions:
+            self._stop(watch)
+
+    def _stop(self, watch: _Watch) -> None:
+        if watch.task is not None and watch.task is not asyncio.current_task():
+            watch.task.cancel()
+        self._watches.pop(watch.uri, None)
+
+    async def read(self, email: str, date_str: str) -> Dict[str, Any]:
+        """Current state of a user-day, from the shared snapshot when it is watched"""
+        watch = self._watches.get(f"ultrahuman://{email}/{date_str}")
+        if watch is not None and watch.snapshot is not None:
+            return {"metrics": watch.snapshot, "changes": watch.changes, "updated_at": watch.updated_at}
+        metrics = await fetch_day_metrics(email, date_str)
+        return {"metrics": metrics, "changes": [], "updated_at": time.time()}
+
+    async def _poll(self, watch: _Watch) -> None:
+        while watch.sessions and time.time() < day_settled_at(watch.date):
+            try:
+                with tracer.trace("watch.poll", slow_log=False):
+                    metrics = await fetch_day_metrics(watch.email, watch.date, use_cache=False)
+            except Exception as e:
+                logger.warning("Polling %s failed: %s", watch.uri, e)
+            else:
+                if watch.snapshot is None:
+                    watch.snapshot, watch.updated_at = metrics, time.time()
+                else:
+                    changes = diff_metrics(watch.snapshot, metrics)
+                    if changes:
+                        watch.snapshot, watch.changes, watch.updated_at = metrics, changes, time.time()
+                        await self._notify(watch)
+            await asyncio.sleep(self.interval)
+        watch.task = None
+        # Either every subscriber left or the day settled; drop the watch with its sessions
+        if self._watches.get(watch.uri) is watch:
+            del self._watches[watch.uri]
+
+    async def _notify(self, watch: _Watch) -> None:
+        for session in list(watch.sessions):
+            try:
+                await session.send_resource_updated(AnyUrl(watch.uri))
+            except Exception:
+                # Session is gone without unsubscribing
+                watch.sessions.discard(session)
+        if not watch.sessions:
+            self._stop(watch)
+
+
+metrics_watcher = MetricsWatcher(WATCH_INTERVAL)
+
+
+@mcp.resource("ultrahuman://{email}/{date}", mime_type="application/json")
+async def get_day_resource(email: str, date: str) -> Dict[str, Any]:
+    """
+    Health metrics for a user on a date, subscribable for live updates.
+
+    Subscribing to a day that can still change (today, or yesterday until
+    its late syncs are in) starts a single shared poller that sends
+    resource-updated notifications only when the metrics change. Each read
+    returns the latest metrics and the changes from the last update.
+    """
+    if not ULTRAHUMAN_AUTH_KEY:
+        raise ValueError("ULTRAHUMAN_AUTH_KEY environment variable is required")
+
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("Date must be in YYYY-MM-DD format")
+
+    try:
+        state = await metrics_watcher.read(email, date)
+        return {
+            "success": True,
+            "email": email,
+            "date": date,
+            **state
+        }
+    except httpx.HTTPStatusError as e:
+        return {
+            "success": False,
+            "error": f"HTTP {e.response.status_code}: {e.response.text}",
+            "email": email,
+            "date": date
+        }
+
+
+@mcp._mcp_server.subscribe_resource()
+async def _subscribe_resource(uri: AnyUrl) -> None:
+    await metrics_watcher.subscribe(str(uri), mcp._mcp_server.request_context.session)
+
+
+@mcp._mcp_server.unsubscribe_resource()
+async def _unsubscribe_resource(uri: AnyUrl) -> None:
+    await metrics_watcher.unsubscribe(str(uri), mcp._mcp_server.request_context.session)
+
+
+_base_get_capabilities = mcp._mcp_server.get_capabilities
+
+
+def _get_capabilities(*args, **kwargs):
+    # The low-level server always reports subscribe=False for resources
+    capabilities = _base_get_capabilities(*args, **kwargs)
+    if capabilities.resources is not None:
+        capabilities.resources.subscribe = True
+    return capabilities
+
+
+mcp._mcp_server.get_capabilities = _get_capabilities
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(max(1, min(level, 9)), zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=max(0, min(level, 11)))
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=max(1, min(level, 22))).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Supported response encodings, in server preference order
+ENCODERS = {"gzip": _GzipEncoder}
+if brotli:
+    ENCODERS = {"br": _BrotliEncoder, **ENCODERS}
+if zstandard:
+    ENCODERS = {"zstd": _ZstdEncoder, **ENCODERS}
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+
+    best = None
+    for name in ENCODERS:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > 0 and (best is None or q > weights.get(best, weights.get("*", 0.0))):
+            best = name
+    return best
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing HTTP responses with gzip, br or zstd.
+
+    Bodies below minimum_size are sent as-is. For streamed responses the
+    decision is made on the first chunk: Streamable HTTP answers each POST
+    with a one-event SSE stream, so a small first event means a small
+    response. Compressed streams are flushed per chunk so every event still
+    reaches the client immediately.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, level: int = 6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if encoder is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if (
+                    "content-encoding" in headers
+                    or start_message["status"] in (204, 304)
+                    # An empty first chunk of a stream says nothing about its size
+                    or (len(body) < self.minimum_size and (body or not more_body))
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                encoder = ENCODERS[encoding](self.level)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    body = encoder.compress(body) + encoder.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+
+            chunk = encoder.compress(body) if body else b""
+            if not more_body:
+                chunk += encoder.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class _Startup:
+    """Startup timings and warm-up state reported by the readiness probe"""
+
+    def __init__(self):
+        self.import_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.upstream_warm = False
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+startup = _Startup()
+
+
+async def _warm_upstream() -> None:
+    try:
+        # Any response will do: the point is the pooled, handshaken connection
+        await get_http_client().head(ULTRAHUMAN_BASE_URL)
+        startup.upstream_warm = True
+    except httpx.HTTPError as e:
+        logger.warning("Upstream warm-up failed: %s", e)
+
+
+async def warm_up() -> None:
+    """Pre-warm what the first tool call would otherwise pay for.
+
+    Builds the shared upstream client and opens a pooled connection to the
+    upstream API while the server is already accepting connections.
+    Readiness is reported once this finishes, even if the upstream API is
+    unreachable, so an outage doesn't keep the container from ever becoming
+    ready. NumPy is deliberately left to load on first use by an analytics
+    tool: importing it in the background right after readiness holds the
+    GIL and slows exactly the first requests the warm-up is meant to speed up.
+    """
+    started = time.perf_counter()
+    await _warm_upstream()
+    startup.warmup_seconds = time.perf_counter() - started
+    startup.ready.set()
+    logger.info("Warm-up finished in %.3fs", startup.warmup_seconds)
+
+
+@mcp.custom_route("/health", methods=["GET"])
+async def health_route(request: Request) -> JSONResponse:
+    return JSONResponse({"status": "ok"})
+
+
+@mcp.custom_route("/ready", methods=["GET"])
+async def ready_route(request: Request) -> JSONResponse:
+    ready = startup.ready.is_set()
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "warming",
+            "import_seconds": startup.import_seconds,
+            "warmup_seconds": startup.warmup_seconds,
+            "upstream_warm": startup.upstream_warm
+        },
+        status_code=200 if ready else 503
+    )
+
+
+startup.import_seconds = round(time.perf_counter() - _IMPORT_STARTED, 3)
+
+
+async def serve(port: int) -> None:
+    middleware = []
+    if COMPRESSION_ENABLED:
+        middleware.append(
+            Middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE, level=COMPRESSION_LEVEL)
+        )
+    if WARMUP_ENABLED:
+        startup.task = asyncio.create_task(warm_up())
+    else:
+        startup.ready.set()
+    await mcp.run_async(transport="http", host="0.0.0.0", port=port, middleware=middleware)
+
+
 if __name__ == "__main__":
     # Run the server with HTTP transport for web deployment
-    port = int(os.getenv("PORT", 8000))
-    mcp.run(transport="http", host="0.0.0.0", port=port)
+    logger.info("Imported in %.3fs", startup.import_seconds)
+    asyncio.run(serve(int(os.getenv("PORT", 8000))))
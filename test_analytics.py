@@ -0,0 +1,229 @@
+"""
+Tests for the numeric helpers behind the analytics tools, checked against
+hand-computed values and the equivalent NumPy reference calls
+
+Run with: python -m pytest test_analytics.py (or python test_analytics.py)
+"""
+import math
+import subprocess
+import sys
+
+import numpy as np
+
+from main import (
+    binned_percentiles,
+    cohort_summary,
+    compact_sleep,
+    daily_value,
+    encode_stages,
+    glucose_profile,
+    lagged_correlations,
+    pairwise_correlation,
+    percentile_ranks,
+    rolling_anomalies,
+    series_arrays,
+)
+
+
+def close(a, b, tol=1e-9):
+    return np.allclose(a, b, atol=tol, equal_nan=True)
+
+
+def test_rolling_zscore_uses_only_prior_days():
+    values = np.array([[1.0], [2.0], [3.0], [4.0], [100.0]])
+    stats = rolling_anomalies(values, window=4, ewma_span=3)
+    # Fewer than min_periods (3) prior days: no baseline yet
+    assert np.isnan(stats["z_score"][:3, 0]).all()
+    # Day 3 against [1, 2, 3]: mean 2, sample std 1
+    assert close(stats["mean"][3, 0], 2.0) and close(stats["std"][3, 0], 1.0)
+    assert close(stats["z_score"][3, 0], 2.0)
+    # Day 4 against [1, 2, 3, 4]: mean 2.5, sample std sqrt(5/3)
+    assert close(stats["z_score"][4, 0], 97.5 / math.sqrt(5 / 3))
+
+
+def test_rolling_ewma_weights_recent_days_more():
+    values = np.array([[1.0], [2.0], [3.0]])
+    stats = rolling_anomalies(values, window=4, ewma_span=3)
+    # alpha = 0.5: day 2 sees 2 with weight 1 and 1 with weight 0.5
+    assert np.isnan(stats["ewma"][0, 0])
+    assert close(stats["ewma"][1, 0], 1.0)
+    assert close(stats["ewma"][2, 0], (2 * 1 + 1 * 0.5) / 1.5)
+
+
+def test_rolling_ignores_missing_days():
+    values = np.array([[1.0], [np.nan], [2.0], [3.0], [4.0]])
+    stats = rolling_anomalies(values, window=4, ewma_span=3)
+    # Day 4 against [1, nan, 2, 3]: mean 2, sample std 1
+    assert close(stats["z_score"][4, 0], 2.0)
+
+
+def test_change_score_is_welch_t():
+    values = np.array([[1.0, 2, 3, 1, 2, 3, 11, 12, 13, 11, 12, 13]]).T
+    stats = rolling_anomalies(values, window=6)
+    # Before: mean 2, var 0.8, n 6; after: mean 12, var 0.8, n 6
+    assert close(stats["after_mean"][6, 0], 12.0)
+    assert close(stats["change_score"][6, 0], 10 / math.sqrt(0.8 / 6 + 0.8 / 6))
+
+
+def test_binned_percentiles_match_numpy():
+    rng = np.random.default_rng(0)
+    bins = rng.integers(0, 6, 500)
+    bins[bins == 4] = 3  # leave bin 4 empty
+    values = rng.normal(100, 15, 500)
+    result = binned_percentiles(bins, values, 6, (5, 25, 50, 75, 95))
+    for p, curve in result.items():
+        for b in range(6):
+            expected = np.percentile(values[bins == b], p) if (bins == b).any() else np.nan
+            assert close(curve[b], expected), (p, b)
+
+
+def test_glucose_target_range_includes_both_edges():
+    values = np.array([53.9, 54.0, 69.9, 70.0, 180.0, 180.1, 250.0, 250.1])
+    profile = glucose_profile(np.arange(len(values)) * 300.0, values)
+    assert profile["time_in_ranges"] == {
+        "very_low": 12.5, "low": 25.0, "in_range": 25.0, "high": 25.0, "very_high": 12.5
+    }
+
+
+def test_series_arrays_drops_null_samples():
+    points = [
+        {"timestamp": 1_700_000_000_000, "value": 100},
+        {"timestamp": 1_700_000_300_000, "value": None},
+        {"timestamp": 1_700_000_600_000, "value": 120.5},
+        {"timestamp": None, "value": 90},
+    ]
+    timestamps, values = series_arrays({"values": points})
+    assert close(timestamps, [1_700_000_000, 1_700_000_600])
+    assert close(values, [100, 120.5])
+    assert series_arrays([{"timestamp": 1, "value": None}]) is None
+    assert daily_value({"heart_rate": {"values": points}}, "heart_rate") == 110.25
+
+    profile = glucose_profile(*series_arrays(points))
+    assert profile["mean_glucose"] == round(110.25, 1)
+    assert profile["time_in_ranges"]["in_range"] == 100.0
+
+
+def test_pairwise_correlation_hand_values():
+    a = np.array([[1.0, 2, 3, 4, 5]]).T
+    b = np.array([[2.0, 4, 6, 8, 10], [5.0, 4, 3, 2, 1], [1.0, 2, 1, 2, 1]]).T
+    r, n = pairwise_correlation(a, b)
+    assert close(r[0], [1.0, -1.0, 0.0])
+    assert n.tolist() == [[5, 5, 5]]
+
+
+def test_pairwise_correlation_matches_corrcoef_with_gaps():
+    rng = np.random.default_rng(1)
+    x = rng.normal(size=(60, 4))
+    x[:, 1] += x[:, 0]
+    x[rng.random(x.shape) < 0.2] = np.nan
+    r, n = pairwise_correlation(x, x, min_overlap=5)
+    for i in range(4):
+        for j in range(4):
+            both = ~np.isnan(x[:, i]) & ~np.isnan(x[:, j])
+            assert n[i, j] == both.sum()
+            assert close(r[i, j], np.corrcoef(x[both, i], x[both, j])[0, 1])
+
+
+def test_pairwise_correlation_min_overlap_and_constant_columns():
+    a = np.array([[1.0, 2, np.nan, np.nan], [3.0, 3, 3, 3]]).T
+    r, _ = pairwise_correlation(a, a, min_overlap=3)
+    # Column 0 has two points; column 1 has zero variance
+    assert np.isnan(r).all()
+
+
+def test_lagged_correlation_aligns_day_t_with_day_t_plus_lag():
+    lead = np.arange(10.0)
+    follow = np.roll(lead ** 2, 1)  # follow[t + 1] = lead[t] ** 2
+    values = np.column_stack([lead, follow])
+    r, n = lagged_correlations(values, [1])[1]
+    assert n[0, 1] == 9
+    assert close(r[0, 1], np.corrcoef(lead[:-1], lead[:-1] ** 2)[0, 1])
+
+
+def test_encode_stages_hand_values():
+    encoded = encode_stages(["light", "light", "deep", "awake", "light"], start=1000, epoch_seconds=30)
+    assert encoded["segments"] == [["light", 1000, 60], ["deep", 1060, 30], ["awake", 1090, 30], ["light", 1120, 30]]
+    assert encoded["totals_seconds"] == {"light": 90, "deep": 30, "awake": 30}
+    assert encoded["efficiency_percent"] == 80.0
+
+
+def test_compact_sleep_tolerates_odd_series():
+    sleep_data = {
+        "bedtime_start": 0,
+        "ragged": [[1, 2], [3]],
+        "tags": ["x", "y"],
+        "stages": [{"timestamp": 0, "stage": None}, {"timestamp": 30, "stage": "rem"}, {"timestamp": 60, "stage": "awake"}],
+    }
+    compact = compact_sleep(sleep_data)
+    assert compact["ragged"] == [[1, 2], [3]]
+    assert compact["tags"] == ["x", "y"]
+    # The null stage is kept as an unknown epoch that counts as neither sleep nor wake
+    assert compact["stages"]["totals_seconds"] == {"unknown": 30, "rem": 30, "awake": 30}
+    assert compact["stages"]["efficiency_percent"] == 50.0
+
+
+def test_percentile_ranks_hand_values():
+    values = np.array([[10.0], [20.0], [20.0], [40.0]])
+    # (values below + half the ties, including itself) / n
+    assert close(percentile_ranks(values)[:, 0], [12.5, 50.0, 50.0, 87.5])
+
+
+def test_percentile_ranks_skip_missing_values_per_column():
+    values = np.array([[1.0, np.nan], [2.0, 5.0], [3.0, 7.0], [np.nan, np.nan]])
+    ranks = percentile_ranks(values)
+    assert close(ranks[:, 0], [100 / 6, 50.0, 500 / 6, np.nan])
+    assert close(ranks[:, 1], [np.nan, 25.0, 75.0, np.nan])
+
+
+def test_percentile_ranks_match_brute_force():
+    rng = np.random.default_rng(2)
+    values = rng.integers(0, 20, (200, 3)).astype(np.float64)
+    values[rng.random(values.shape) < 0.1] = np.nan
+    ranks = percentile_ranks(values)
+    for col in range(3):
+        cohort = values[~np.isnan(values[:, col]), col]
+        for row in range(200):
+            v = values[row, col]
+            expected = np.nan if np.isnan(v) else ((cohort < v).sum() + 0.5 * (cohort == v).sum()) / len(cohort) * 100
+            assert close(ranks[row, col], expected)
+
+
+def test_cohort_summary_matches_numpy():
+    values = np.array([[1.0, np.nan], [2.0, np.nan], [3.0, np.nan], [10.0, np.nan]])
+    summary = cohort_summary(values)
+    assert summary["n"].tolist() == [4, 0]
+    assert close(summary["mean"][0], 4.0) and close(summary["std"][0], np.std([1, 2, 3, 10]))
+    assert close(summary["p50"][0], 2.5) and close(summary["p95"][0], np.percentile([1, 2, 3, 10], 95))
+    assert close(summary["min"][0], 1.0) and close(summary["max"][0], 10.0)
+    # A metric nobody has summarizes to NaN instead of raising
+    assert np.isnan(summary["mean"][1]) and np.isnan(summary["p50"][1])
+
+
+
+def test_numpy_is_loaded_lazily_and_safely_from_threads():
+    script = """
+import sys, threading
+import main
+assert "numpy" not in sys.modules
+errors = []
+barrier = threading.Barrier(8)
+def touch():
+    barrier.wait()
+    try:
+        main.np.zeros(3)
+    except Exception as e:
+        errors.append(e)
+threads = [threading.Thread(target=touch) for _ in range(8)]
+for t in threads: t.start()
+for t in threads: t.join()
+assert not errors, errors
+assert main.np is sys.modules["numpy"]
+"""
+    subprocess.run([sys.executable, "-c", script], check=True, capture_output=True)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,57 @@
+"""
+Tests for the compact in-memory metrics cache
+
+Run with: python -m pytest test_cache.py (or python test_cache.py)
+"""
+import json
+import time
+
+from main import DayRecord, MetricsCache, day_settled_at
+
+
+def roundtrip(metrics):
+    return DayRecord(json.loads(json.dumps(metrics)), time.time()).to_dict()
+
+
+def test_mixed_int_float_series_keep_their_types():
+    metrics = {"heart_rate": [{"timestamp": 1, "value": 60}, {"timestamp": 2, "value": 61.5}]}
+    restored = roundtrip(metrics)
+    assert restored == metrics
+    assert json.dumps(restored) == json.dumps(metrics)
+
+
+def test_plain_number_lists_keep_their_types():
+    metrics = {"steps_by_hour": [0, 12.5, 3], "ints": [1, 2, 3], "floats": [1.0, 2.5]}
+    assert json.dumps(roundtrip(metrics)) == json.dumps(metrics)
+
+
+def test_large_ints_are_exact():
+    metrics = {"ids": [2 ** 53 + 1, 0.5], "huge": [2 ** 64, 1], "scalar": 2 ** 60}
+    assert roundtrip(metrics) == metrics
+
+
+def test_unsettled_days_expire_after_ttl():
+    cache = MetricsCache(max_days=10, today_ttl=0)
+    today = time.strftime("%Y-%m-%d", time.gmtime())
+    yesterday = time.strftime("%Y-%m-%d", time.gmtime(time.time() - 86400))
+    cache.put("a@b.c", today, {"hrv": 1})
+    cache.put("a@b.c", yesterday, {"hrv": 1})
+    cache.put("a@b.c", "2024-01-15", {"hrv": 1})
+    time.sleep(0.01)
+    assert cache.get("a@b.c", today) is None
+    assert cache.get("a@b.c", yesterday) is None
+    assert cache.get("a@b.c", "2024-01-15") == {"hrv": 1}
+
+
+def test_settled_day_fetched_before_it_settled_still_expires():
+    cache = MetricsCache(max_days=10, today_ttl=60)
+    cache.put("a@b.c", "2024-01-15", {"hrv": 1})
+    cache._records[("a@b.c", "2024-01-15")].fetched_at = day_settled_at("2024-01-15") - 3600
+    assert cache.get("a@b.c", "2024-01-15") is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,106 @@
+"""
+Tests for HTTP response compression: Accept-Encoding negotiation and the ASGI middleware
+
+Run with: python -m pytest test_compression.py (or python test_compression.py)
+"""
+import asyncio
+import gzip
+
+from main import ENCODERS, CompressionMiddleware, negotiate_encoding
+
+PREFERRED = next(iter(ENCODERS))
+
+
+def test_q_zero_rules_an_encoding_out():
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("gzip;level=1;q=0") is None
+    assert negotiate_encoding("gzip; q=0.0, identity") is None
+
+
+def test_wildcard_allows_every_encoding_unless_excluded():
+    assert negotiate_encoding("*") == PREFERRED
+    assert negotiate_encoding(f"*, {PREFERRED};q=0") == [n for n in ENCODERS if n != PREFERRED][0]
+    assert negotiate_encoding("*;q=0") is None
+
+
+def test_higher_q_wins():
+    assert negotiate_encoding(f"gzip;q=1, {PREFERRED};q=0.5") == "gzip"
+
+
+def test_ties_follow_server_preference_order():
+    names = list(ENCODERS)
+    assert negotiate_encoding(", ".join(reversed(names))) == names[0]
+    assert negotiate_encoding(", ".join(f"{n};q=0.5" for n in reversed(names))) == names[0]
+
+
+def test_unsupported_and_malformed_values():
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("compress, identity") is None
+    assert negotiate_encoding("gzip;q=abc") is None
+    assert negotiate_encoding("GZIP") == "gzip"
+
+
+def run_app(chunks, accept_encoding="gzip", minimum_size=100, content_type=b"application/json"):
+    """Send chunks through the middleware; returns (start message, body messages)"""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=minimum_size)(scope, receive, send))
+    return sent[0], sent[1:]
+
+
+def header(start, name):
+    return dict(start["headers"]).get(name.encode())
+
+
+def test_small_body_is_sent_uncompressed():
+    start, bodies = run_app([b"x" * 50])
+    assert header(start, "content-encoding") is None
+    assert bodies[0]["body"] == b"x" * 50
+
+
+def test_large_body_is_compressed_with_length():
+    start, bodies = run_app([b"x" * 5000])
+    assert header(start, "content-encoding") == b"gzip"
+    assert int(header(start, "content-length")) == len(bodies[0]["body"])
+    assert gzip.decompress(bodies[0]["body"]) == b"x" * 5000
+
+
+def test_small_sse_event_is_sent_uncompressed():
+    event = b"event: message\ndata: {}\n\n"
+    start, bodies = run_app([event, b""], content_type=b"text/event-stream")
+    assert header(start, "content-encoding") is None
+    assert b"".join(m["body"] for m in bodies) == event
+
+
+def test_large_stream_is_compressed_and_flushed_per_chunk():
+    chunks = [b"data: " + b"y" * 500 + b"\n\n", b"data: " + b"z" * 500 + b"\n\n", b""]
+    start, bodies = run_app(chunks, content_type=b"text/event-stream")
+    assert header(start, "content-encoding") == b"gzip"
+    assert header(start, "content-length") is None
+    assert all(m["body"] for m in bodies[:2])  # each event is flushed, not buffered
+    assert gzip.decompress(b"".join(m["body"] for m in bodies)) == b"".join(chunks)
+
+
+def test_no_acceptable_encoding_passes_through():
+    start, bodies = run_app([b"x" * 5000], accept_encoding="identity")
+    assert header(start, "content-encoding") is None
+    assert bodies[0]["body"] == b"x" * 5000
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,160 @@
+"""
+Tests for export_history: schema growth across batches, resume and truncation
+
+Run with: python -m pytest test_export.py (or python test_export.py)
+"""
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import tempfile
+
+import main
+
+DATES = [f"2025-01-{day:02d}" for day in range(1, 9)]
+
+
+def day_metrics(email, date_str):
+    day = int(date_str[-2:])
+    metrics = {"hrv": {"value": day}, "steps": day * 100, "heart_rate": [{"timestamp": 1, "value": 60}]}
+    if day >= 5:
+        # A metric that only appears in a later batch
+        metrics["glucose"] = {"average": 90.5 + day}
+    return metrics
+
+
+@contextlib.contextmanager
+def export_env(batch_days=3):
+    saved = (main.ULTRAHUMAN_AUTH_KEY, main.EXPORT_DIR, main.EXPORT_BATCH_DAYS, main.fetch_day_metrics)
+
+    async def fake_fetch(email, date_str, use_cache=True, store=True):
+        return day_metrics(email, date_str)
+
+    with tempfile.TemporaryDirectory() as directory:
+        main.ULTRAHUMAN_AUTH_KEY = "test"
+        main.EXPORT_DIR = directory
+        main.EXPORT_BATCH_DAYS = batch_days
+        main.fetch_day_metrics = fake_fetch
+        try:
+            yield directory
+        finally:
+            main.ULTRAHUMAN_AUTH_KEY, main.EXPORT_DIR, main.EXPORT_BATCH_DAYS, main.fetch_day_metrics = saved
+
+
+def export(filename, format, resume=True):
+    return asyncio.run(main.export_history.fn(["a@b.c"], DATES[0], DATES[-1], filename, format, resume))
+
+
+def export_interrupted(filename, format, after_batches):
+    """Export until the checkpoint after `after_batches` batches fails to save, as if the process died"""
+    save = main._save_checkpoint
+    calls = []
+
+    def failing_save(path, checkpoint):
+        calls.append(path)
+        if len(calls) > after_batches:
+            raise KeyboardInterrupt
+        save(path, checkpoint)
+
+    main._save_checkpoint = failing_save
+    try:
+        export(filename, format)
+    except KeyboardInterrupt:
+        pass
+    else:
+        raise AssertionError("export was not interrupted")
+    finally:
+        main._save_checkpoint = save
+
+
+def read_ndjson(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def read_parquet(path):
+    import pyarrow.parquet as pq
+    return pq.read_table(path, schema=pq.read_schema(os.path.join(path, "_common_metadata"))).to_pylist()
+
+
+def test_csv_keeps_columns_added_in_later_batches():
+    with export_env() as directory:
+        result = export("history.csv", "csv")
+        rows = read_csv(os.path.join(directory, "history.csv"))
+    assert result["success"] and result["days_written"] == len(DATES)
+    assert [row["date"] for row in rows] == DATES
+    assert list(rows[0]) == ["email", "date", "hrv.value", "steps", "glucose.average"]
+    assert [row["glucose.average"] for row in rows] == [""] * 4 + ["95.5", "96.5", "97.5", "98.5"]
+    assert rows[0]["steps"] == "100"
+
+
+def test_parquet_keeps_columns_added_in_later_batches():
+    if not main.PYARROW_AVAILABLE:
+        return
+    with export_env() as directory:
+        export("history.parquet", "parquet")
+        rows = read_parquet(os.path.join(directory, "history.parquet"))
+    assert [row["date"] for row in rows] == DATES
+    assert [row["glucose.average"] for row in rows] == [None] * 4 + [95.5, 96.5, 97.5, 98.5]
+    assert rows[-1]["steps"] == 800
+
+
+def test_resume_after_interruption_matches_a_clean_export():
+    formats = {"ndjson": read_ndjson, "csv": read_csv}
+    if main.PYARROW_AVAILABLE:
+        formats["parquet"] = read_parquet
+    for format, read in formats.items():
+        # Batch 2 (days 4-6) introduces the glucose column and is written but never checkpointed
+        filename = f"history.{format}"
+        with export_env() as directory:
+            export_interrupted(filename, format, after_batches=1)
+            result = export(filename, format)
+            resumed = read(os.path.join(directory, filename))
+            assert not os.path.exists(os.path.join(directory, f"{filename}.rewrite"))
+        with export_env() as directory:
+            export(filename, format)
+            clean = read(os.path.join(directory, filename))
+        assert result["resumed_from"] == 3, format
+        assert resumed == clean, format
+
+
+def test_resume_swaps_in_a_checkpointed_csv_rewrite():
+    with export_env() as directory:
+        path = os.path.join(directory, "history.csv")
+        writer = main._CsvExport(path, {})
+        writer.write([{"email": "a", "date": "1", "x": 1}])
+        writer.write([{"email": "a", "date": "2", "x": 2, "y": 3}])
+        state = writer.state()  # checkpoint saved, then interrupted before commit()
+        writer = main._CsvExport(path, state)
+        writer.write([{"email": "a", "date": "3", "y": 4}])
+        rows = read_csv(path)
+    assert rows == [
+        {"email": "a", "date": "1", "x": "1", "y": ""},
+        {"email": "a", "date": "2", "x": "2", "y": "3"},
+        {"email": "a", "date": "3", "x": "", "y": "4"},
+    ]
+
+
+def test_resume_false_truncates_the_previous_export():
+    with export_env() as directory:
+        path = os.path.join(directory, "history.ndjson")
+        export("history.ndjson", "ndjson")
+        with open(path, "a") as f:
+            f.write("partial line from a crashed run")
+        result = export("history.ndjson", "ndjson", resume=False)
+        lines = read_ndjson(path)
+    assert result["resumed_from"] == 0
+    assert [line["date"] for line in lines] == DATES
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")